@@ -0,0 +1,187 @@
+'''!@file                          autotune.py
+    @brief                         A relay feedback auto-tuner for the control loops of the robot.
+    @details                       A file with the RelayTuner class, which replaces the controller
+                                   of one loop with a relay so that the loop oscillates at its
+                                   ultimate period, measures the ultimate gain and period from the
+                                   oscillation, and computes new gains from them. The tuner does
+                                   a little work each time it is updated, so it is run by a task
+                                   without blocking the scheduler. The gains are saved to
+                                   gains.json on the Nucleo and loaded into the PID objects at
+                                   start-up by load_gains().
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+from array import array
+from math import pi
+import json
+from time import ticks_ms, ticks_diff
+
+## The file the tuned gains are saved to
+GAINS_FILE = 'gains.json'
+
+class RelayTuner:
+    '''!@brief                          A class to run a relay experiment on one loop and tune its gains.
+        @details                        Objects of this class are given the measured value each run and
+                                        return the output of the relay, which is the offset plus the
+                                        amplitude while the measured value is below the set point and the
+                                        offset minus the amplitude while it is above, with a hysteresis band
+                                        so that noise doesn't switch the relay. The time of each switch up
+                                        and the highest and lowest measured values in between are stored in
+                                        arrays. Once the oscillation has settled and enough cycles have
+                                        been measured, the ultimate period is the average time between
+                                        switches up and the ultimate gain is found from the describing
+                                        function of the relay, 4*amplitude/(pi*a), where a is half the peak
+                                        to peak oscillation.
+    '''
+
+    def __init__(self, set_point, amplitude, offset=0, hysteresis=0, num_cycles=4, settle_cycles=2, timeout=15_000):
+        '''!@brief                      Creates an object of the RelayTuner class.
+            @param set_point            The measured value the relay switches around
+            @param amplitude            The change of the output either side of the offset
+            @param offset               The output at the middle of the relay, such as the duty cycle which
+                                        holds the wheel near the set point
+            @param hysteresis           The distance past the set point the measured value must go before
+                                        the relay switches
+            @param num_cycles           The number of cycles averaged to find the ultimate gain and period
+            @param settle_cycles        The number of cycles skipped first while the oscillation settles
+            @param timeout              The longest time in milliseconds the experiment can take
+        '''
+        self.set_point = set_point
+        self.amplitude = amplitude
+        self.offset = offset
+        self.hysteresis = hysteresis
+        self.num_cycles = num_cycles
+        self.settle_cycles = settle_cycles
+        self.timeout = timeout
+        # Create the arrays of the period and peak to peak size of each measured cycle
+        self.periods = array('f', num_cycles*[0])
+        self.sizes = array('f', num_cycles*[0])
+        self.reset()
+
+    def reset(self):
+        '''!@brief                      Starts the experiment over.
+        '''
+        self.output = 1
+        self.num_switches = 0
+        self.num_measured = 0
+        self.start_time = None
+        self.switch_time = 0
+        self.cycle_max = -1e30
+        self.cycle_min = 1e30
+        self.K_u = 0
+        self.P_u = 0
+        self.failed = False
+
+    def update(self, meas):
+        '''!@brief                      Adds a measured value and finds the relay output.
+            @param meas                 The measured value
+            @return                     The relay output
+        '''
+        now = ticks_ms()
+        if self.start_time is None:
+            self.start_time = now
+        if self.done():
+            return self.offset
+        if ticks_diff(now, self.start_time) >= self.timeout:
+            self.failed = True
+            return self.offset
+
+        if meas > self.cycle_max:
+            self.cycle_max = meas
+        if meas < self.cycle_min:
+            self.cycle_min = meas
+
+        if self.output > 0 and meas > self.set_point + self.hysteresis:
+            self.output = -1
+        elif self.output < 0 and meas < self.set_point - self.hysteresis:
+            # A full cycle ends each time the relay switches up
+            self.output = 1
+            if self.num_switches > self.settle_cycles:
+                n = self.num_measured
+                self.periods[n] = ticks_diff(now, self.switch_time)
+                self.sizes[n] = self.cycle_max - self.cycle_min
+                self.num_measured = n + 1
+                if self.num_measured >= self.num_cycles:
+                    self.finish()
+            self.num_switches += 1
+            self.switch_time = now
+            self.cycle_max = meas
+            self.cycle_min = meas
+        return self.offset + self.output*self.amplitude
+
+    def finish(self):
+        '''!@brief                      Finds the ultimate gain and period from the measured cycles.
+            @details                    Half of the peak to peak size is corrected for the hysteresis
+                                        band before the describing function is used.
+        '''
+        period = 0
+        size = 0
+        for n in range(self.num_cycles):
+            period += self.periods[n]
+            size += self.sizes[n]
+        half_size = size/(2*self.num_cycles)
+        if half_size > self.hysteresis:
+            half_size = (half_size*half_size - self.hysteresis*self.hysteresis)**0.5
+        self.P_u = period/self.num_cycles/1000
+        if half_size > 0:
+            self.K_u = 4*self.amplitude/(pi*half_size)
+        else:
+            self.failed = True
+
+    def done(self):
+        '''!@brief                      Checks if the experiment is over.
+            @return                     True if the ultimate gain and period have been found or the
+                                        experiment has failed, False if it is still running
+        '''
+        return self.K_u > 0 or self.failed
+
+    def gains(self, kind='PI'):
+        '''!@brief                      Computes the controller gains from the ultimate gain and period.
+            @details                    A PI controller is tuned with the Tyreus-Luyben rule, K_p = K_u/3.2
+                                        and an integral time of 2.2*P_u, which overshoots much less than
+                                        Ziegler-Nichols. A P controller is tuned with the Ziegler-Nichols
+                                        rule, K_p = K_u/2.
+            @param kind                 'PI' or 'P' for the kind of controller
+            @return                     A tuple of the proportional and integral gains
+        '''
+        if kind == 'P':
+            return self.K_u/2, 0
+        K_p = self.K_u/3.2
+        return K_p, K_p/(2.2*self.P_u)
+
+def save_gains(name, K_p, K_i, K_u=0, P_u=0, filename=GAINS_FILE):
+    '''!@brief                          Saves the gains of one loop, keeping the gains of the other loops.
+        @param name                     The name of the loop, such as 'L', 'R', or 'yaw'
+        @param K_p                      The proportional gain
+        @param K_i                      The integral gain
+        @param K_u                      The ultimate gain the gains were found from
+        @param P_u                      The ultimate period in seconds the gains were found from
+        @param filename                 The name of the file with the gains
+    '''
+    try:
+        with open(filename) as gains_file:
+            all_gains = json.load(gains_file)
+    except (OSError, ValueError):
+        all_gains = {}
+    all_gains[name] = {'K_p': K_p, 'K_i': K_i, 'K_u': K_u, 'P_u': P_u}
+    with open(filename, 'w') as gains_file:
+        json.dump(all_gains, gains_file)
+
+def load_gains(cont, name, filename=GAINS_FILE):
+    '''!@brief                          Loads the saved gains of one loop into its controller.
+        @details                        The anti-windup gain is set again from the new gains by
+                                        PID.set_gains(). If no gains have been saved for the
+                                        loop, the controller keeps its hand-tuned gains.
+        @param cont                     The PID object of the loop
+        @param name                     The name of the loop, such as 'L', 'R', or 'yaw'
+        @param filename                 The name of the file with the gains
+        @return                         True if the gains were loaded, False if they were not
+    '''
+    try:
+        with open(filename) as gains_file:
+            gains = json.load(gains_file)[name]
+    except (OSError, ValueError, KeyError):
+        return False
+    cont.set_gains(gains['K_p'], gains['K_i'])
+    return True
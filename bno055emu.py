@@ -0,0 +1,305 @@
+'''!@file                          bno055emu.py
+    @brief                         A host-side emulator of the BNO055 IMU on the I2C bus.
+    @details                       A file with a fake I2C object which holds the BNO055 registers
+                                   used by the BNO055 class, so the driver can be run and its I2C
+                                   traffic measured on a computer without the Romi. The fake device
+                                   follows a scripted motion profile for the heading and yaw rate,
+                                   counts the transactions and bytes on the bus, and models the
+                                   time each transaction takes on the wire at a given baud rate.
+                                   Running this file compares the bus time of each control period
+                                   for the different ways of reading the IMU.
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+import builtins
+import sys
+import time
+import types
+
+## I2C address of the BNO055
+BNO055_ADDR = 0x28
+
+class MotionProfile:
+    '''!@brief                          A scripted motion of the Romi for the emulated IMU.
+        @details                        A motion profile is a list of segments, each with a duration in
+                                        seconds and a yaw rate in degrees per second. The heading is found
+                                        by integrating the yaw rate from the starting heading and wraps
+                                        around from 0 to 360 degrees like the BNO055 heading does.
+    '''
+
+    def __init__(self, segments, start_heading=0.0):
+        '''!@brief                      Creates a motion profile.
+            @param segments             A list of (duration, yaw rate) pairs in seconds and degrees per second.
+                                        The last yaw rate is held after the last segment.
+            @param start_heading        The heading at the start of the profile in degrees
+        '''
+        self.segments = segments
+        self.start_heading = start_heading
+
+    def state(self, t):
+        '''!@brief                      Gets the heading and yaw rate at a time in the profile.
+            @param t                    The time since the start of the profile in seconds
+            @return                     The heading in degrees and the yaw rate in degrees per second
+        '''
+        heading = self.start_heading
+        yaw_rate = 0.0
+        for duration, yaw_rate in self.segments:
+            if t <= duration:
+                return (heading + yaw_rate*t) % 360, yaw_rate
+            heading += yaw_rate*duration
+            t -= duration
+        return (heading + yaw_rate*t) % 360, yaw_rate
+
+## A Romi sitting still
+STILL = MotionProfile([(1.0, 0.0)])
+## A Romi driving straight, turning right, and turning back left like a section of the track
+TRACK = MotionProfile([(2.0, 0.0), (1.0, 90.0), (1.5, 0.0), (1.0, -60.0), (2.0, 0.0)])
+## A Romi turning in place at a constant rate
+SPIN = MotionProfile([(1.0, 180.0)])
+
+class FakeI2C:
+    '''!@brief                          A fake I2C bus with an emulated BNO055 on it.
+        @details                        Objects of this class have the mem_read and mem_write methods of a
+                                        pyb.I2C object, so they can be given to the BNO055 class in place of
+                                        the real bus. Reads of the Euler angle and gyro registers return the
+                                        motion profile at the current time, the calibration offsets can only
+                                        be read or written in CONFIG mode, and the system status reads 5 once the
+                                        IMU is in a fusion mode. Each transaction is counted and its time on
+                                        the wire is added up.
+    '''
+
+    def __init__(self, baudrate=100_000, profile=TRACK, calib_status=0xFF, clock=None):
+        '''!@brief                      Creates a fake I2C bus with an emulated BNO055.
+            @param baudrate             The bus baud rate used to model the wire time of each transaction
+            @param profile              The MotionProfile the emulated IMU follows
+            @param calib_status         The value of the calibration status register at 0x35
+            @param clock                A function returning the time in seconds for the motion profile.
+                                        If it isn't given, the time is the total modeled wire time plus any
+                                        time added with advance().
+        '''
+        self.baudrate = baudrate
+        self.profile = profile
+        self.clock = clock
+        self.time = 0.0
+        # Create the register map, with the chip ID at 0x00
+        self.regs = bytearray(128)
+        self.regs[0x00] = 0xA0
+        self.regs[0x35] = calib_status
+        self.reset_counts()
+
+    def reset_counts(self):
+        '''!@brief                      Sets the transaction, byte, and wire time counts to zero.
+        '''
+        self.transactions = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.wire_us = 0.0
+
+    def advance(self, dt):
+        '''!@brief                      Moves the time of the motion profile forward.
+            @param dt                   The time to add in seconds
+        '''
+        self.time += dt
+
+    def transaction_us(self, num_bytes, read):
+        '''!@brief                      Models the time of one register transaction on the wire.
+            @details                    A write sends a start, the address, the register, the data, and a
+                                        stop. A read sends a start, the address, and the register, then a
+                                        repeated start, the address again, the data, and a stop. Each byte
+                                        takes 9 clocks with its acknowledge bit and each start or stop
+                                        takes about one clock.
+            @param num_bytes            The number of data bytes in the transaction
+            @param read                 True for a read, False for a write
+            @return                     The time of the transaction in microseconds
+        '''
+        if read:
+            bits = 9*(3 + num_bytes) + 3
+        else:
+            bits = 9*(2 + num_bytes) + 2
+        return bits*1_000_000/self.baudrate
+
+    def now(self):
+        '''!@brief                      Gets the time used for the motion profile.
+            @return                     The time in seconds
+        '''
+        if self.clock is not None:
+            return self.clock()
+        return self.time
+
+    def _update_motion(self):
+        '''!@brief                      Puts the motion profile at the current time into the data registers.
+        '''
+        heading, yaw_rate = self.profile.state(self.now())
+        self._put_int16(0x1A, round(heading*16))
+        self._put_int16(0x18, round(yaw_rate*16))
+
+    def _put_int16(self, reg, value):
+        '''!@brief                      Writes a signed 16 bit value into two registers, low byte first.
+            @param reg                  The address of the low byte
+            @param value                The value to write
+        '''
+        value &= 0xFFFF
+        self.regs[reg] = value & 0xFF
+        self.regs[reg + 1] = value >> 8
+
+    def _count(self, addr, num_bytes, read):
+        '''!@brief                      Counts one transaction and its wire time.
+            @param addr                 The I2C address of the transaction
+            @param num_bytes            The number of data bytes
+            @param read                 True for a read, False for a write
+        '''
+        if addr != BNO055_ADDR:
+            raise OSError(19)  # ENODEV, as the real bus does when nothing acknowledges
+        us = self.transaction_us(num_bytes, read)
+        self.transactions += 1
+        self.wire_us += us
+        if read:
+            self.bytes_read += num_bytes
+        else:
+            self.bytes_written += num_bytes
+        if self.clock is None:
+            self.time += us/1_000_000
+
+    def mem_read(self, data, addr, memaddr, **kwargs):
+        '''!@brief                      Reads registers of the emulated BNO055.
+            @details                    Reads of the calibration offsets at 0x55-0x6A return 0xFF unless the
+                                        IMU is in CONFIG mode, since the real chip doesn't return the offsets
+                                        in the other modes.
+            @param data                 A buffer to read into, or a number of bytes to read
+            @param addr                 The I2C address of the device
+            @param memaddr              The address of the first register
+            @return                     The buffer read into
+        '''
+        if isinstance(data, int):
+            data = bytearray(data)
+        num_bytes = len(data)
+        self._count(addr, num_bytes, True)
+        self._update_motion()
+        data[:] = self.regs[memaddr:memaddr + num_bytes]
+        if (self.regs[0x3D] & 0x0F) != 0x00:
+            for n in range(num_bytes):
+                if 0x55 <= memaddr + n <= 0x6A:
+                    data[n] = 0xFF
+        return data
+
+    def mem_write(self, data, addr, memaddr, **kwargs):
+        '''!@brief                      Writes registers of the emulated BNO055.
+            @details                    Writes to the calibration offsets at 0x55-0x6A are ignored unless
+                                        the IMU is in CONFIG mode, as on the real chip. Writing the mode
+                                        register at 0x3D also sets the system status at 0x39.
+            @param data                 An integer or buffer of bytes to write
+            @param addr                 The I2C address of the device
+            @param memaddr              The address of the first register
+        '''
+        if isinstance(data, int):
+            data = bytes([data])
+        num_bytes = len(data)
+        self._count(addr, num_bytes, False)
+        config = (self.regs[0x3D] & 0x0F) == 0x00
+        for n in range(num_bytes):
+            reg = memaddr + n
+            if 0x55 <= reg <= 0x6A and not config:
+                continue
+            self.regs[reg] = data[n]
+        # The system status is 5 in a fusion mode and 0 (idle) otherwise
+        mode = self.regs[0x3D] & 0x0F
+        self.regs[0x39] = 5 if mode >= 0x08 else 0
+
+class _FakePin:
+    '''!@brief                          A fake pyb.Pin with only what the BNO055 class uses.
+    '''
+    OUT_PP = 1
+    IN = 0
+    cpu = types.SimpleNamespace(B8='B8', B9='B9', C9='C9')
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def high(self):
+        pass
+
+    def low(self):
+        pass
+
+def install(fast=True):
+    '''!@brief                          Installs a fake pyb module so the BNO055 class can be imported on a computer.
+        @details                        Adds a pyb module with Pin and I2C, and a micropython module with the
+                                        native and viper decorators, to sys.modules, and adds the
+                                        MicroPython ticks_us, ticks_ms, ticks_diff, ticks_add, and sleep_us
+                                        functions to the time module if they are missing. This must be called before
+                                        BNO055 is imported.
+        @param fast                     If True, time.sleep is replaced so the start-up and mode change
+                                        delays of the BNO055 class don't slow down the benchmark
+    '''
+    pyb = types.ModuleType('pyb')
+    pyb.Pin = _FakePin
+    pyb.I2C = FakeI2C
+    pyb.I2C.CONTROLLER = 0
+    pyb.I2C.MASTER = 0
+    pyb.disable_irq = lambda: 0
+    pyb.enable_irq = lambda state: None
+    sys.modules['pyb'] = pyb
+    if 'micropython' not in sys.modules:
+        micropython = types.ModuleType('micropython')
+        micropython.native = lambda fun: fun
+        micropython.viper = lambda fun: fun
+        micropython.const = lambda value: value
+        sys.modules['micropython'] = micropython
+        # The viper pointer casts give the buffer back, so viper functions run as plain Python
+        for ptr in ('ptr8', 'ptr16', 'ptr32'):
+            setattr(builtins, ptr, lambda buf: buf)
+    if not hasattr(time, 'ticks_us'):
+        time.ticks_us = lambda: time.perf_counter_ns()//1000
+        time.ticks_ms = lambda: time.perf_counter_ns()//1_000_000
+        time.ticks_diff = lambda new, old: new - old
+        time.ticks_add = lambda ticks, delta: ticks + delta
+        time.sleep_us = lambda us: time.sleep(us/1_000_000)
+    if fast:
+        time.sleep = lambda seconds: None
+
+if __name__ == "__main__":
+    install()
+    from BNO055 import BNO055
+    from imusampler import IMUSampler
+    from task_share import SeqShare
+
+    # Compare the bus time of each 8 ms control period over one second of the track
+    # profile for separate yaw rate and heading reads, the 4 byte read of both, the
+    # 12 byte burst read of all the gyro and Euler data, and a 10 ms sampling task.
+    # The 12 byte burst takes more bus time than the separate reads, since it reads
+    # 8 bytes that aren't used; the 4 byte read takes the least.
+    run_time = 1.0
+    control_period = 0.008
+    sample_period = 0.010
+
+    for baudrate in (100_000, 400_000):
+        print(f"I2C at {baudrate//1000} kHz")
+        for method in ("separate", "4 byte", "12 byte", "sampler"):
+            i2c = FakeI2C(baudrate=baudrate)
+            imu = BNO055(i2c, _FakePin.cpu.B9, _FakePin.cpu.B8, _FakePin.cpu.C9)
+            imu.set_mode(0x0C)
+            sampler = IMUSampler(imu, SeqShare('l', 3))
+            i2c.reset_counts()
+
+            if method == "sampler":
+                period = sample_period
+            else:
+                period = control_period
+            num_runs = int(run_time/period)
+            for run in range(num_runs):
+                if method == "separate":
+                    imu.read_yaw_rate()
+                    imu.read_heading()
+                elif method == "4 byte":
+                    imu.read_yaw_rate_heading()
+                elif method == "12 byte":
+                    imu.read_burst()
+                else:
+                    sampler.sample()
+                i2c.advance(period)
+
+            num_ticks = run_time/control_period
+            print(f"  {method:<9s} {i2c.transactions:4d} transactions, "
+                  f"{i2c.bytes_read + i2c.bytes_written:5d} bytes, "
+                  f"{i2c.wire_us/num_ticks:6.1f} us of bus time per control period")
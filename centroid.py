@@ -9,6 +9,15 @@
 '''
 
 from array import array 
+from time import ticks_us, ticks_diff
+
+# The code emitters are only available in MicroPython, and only in ports built
+# with the viper emitter. Elsewhere, such as on a host, the line position is
+# found with plain Python instead.
+try:
+    import micropython
+except ImportError:
+    micropython = None
 
 class Centroid:
     '''!@brief                    A Centroid class to determine a weighted sum
@@ -41,4 +50,213 @@ class Centroid:
              # Add the value times the weight of the senor to the centroid
              self.weight_sum += val * self.weights[i]
         # Return the centroid value
-        return self.weight_sum
\ No newline at end of file
+        return self.weight_sum
+
+## Line feature flag set when no sensor sees the line
+LINE_GAP = 0x01
+## Line feature flag set when a wide black bar, such as the finish line, is under the sensor
+LINE_BAR = 0x02
+## Line feature flag set when the sensor sees more than one separate line, such as at a fork
+LINE_FORK = 0x04
+
+class CentroidTable:
+    '''!@brief                    A CentroidTable class to look up line data from black and white readings
+        @details                  With 8 black or white readings there are only 256 possible patterns,
+                                  so objects of this class work out the weighted sum, the number of
+                                  black sensors, and the line feature flags for every pattern once
+                                  when they are created. Each reading is then a lookup in the sums,
+                                  counts, and flags arrays indexed by the packed sensor mask, which
+                                  doesn't allocate any memory.
+   '''
+   
+    def __init__(self, weights=(-7, -5, -2, -1, 1, 2, 5, 7), bar_count=4):
+        '''!@brief                Initialize a centroid table object.
+            @details              Fills the sums, counts, and flags arrays for every mask.
+            @param weights        The weight of each sensor, in the order of the mask bits
+            @param bar_count      The number of black sensors at or above which the LINE_BAR
+                                  flag is set
+        '''
+        num_sensors = len(weights)
+        num_masks = 1 << num_sensors
+        # Create the weighted sum, black sensor count, and flag of each mask
+        self.sums = array('h', num_masks*[0])
+        self.counts = array('B', num_masks*[0])
+        self.flags = array('B', num_masks*[0])
+        
+        for mask in range(num_masks):
+            weight_sum = 0
+            count = 0
+            runs = 0
+            last_bit = 0
+            for n in range(num_sensors):
+                bit = (mask >> n) & 1
+                if bit:
+                    weight_sum += weights[n]
+                    count += 1
+                    # Count the separate groups of black sensors
+                    if not last_bit:
+                        runs += 1
+                last_bit = bit
+            
+            flags = 0
+            if count == 0:
+                flags |= LINE_GAP
+            if count >= bar_count:
+                flags |= LINE_BAR
+            if runs > 1:
+                flags |= LINE_FORK
+            self.sums[mask] = weight_sum
+            self.counts[mask] = count
+            self.flags[mask] = flags
+
+if hasattr(micropython, 'viper'):
+    @micropython.viper
+    def _peak(values, num_sensors: int) -> int:
+        '''!@brief                Finds the channel with the largest value.
+            @param values         An array('H') of 0-1000 line sensor values
+            @param num_sensors    The number of values in the array
+            @return               The index of the largest value
+        '''
+        buf = ptr16(values)
+        best = 0
+        best_n = 0
+        for n in range(num_sensors):
+            if buf[n] > best:
+                best = buf[n]
+                best_n = n
+        return best_n
+    
+    _native = micropython.native
+else:
+    def _peak(values, num_sensors):
+        best = 0
+        best_n = 0
+        for n in range(num_sensors):
+            if values[n] > best:
+                best = values[n]
+                best_n = n
+        return best_n
+    
+    def _native(fun):
+        return fun
+
+class LinePosition:
+    '''!@brief                    A LinePosition class to find the line position from continuous readings
+        @details                  Objects of this class find the position of the line under the sensor
+                                  from the calibrated 0-1000 values of each channel. The position is
+                                  found by fitting a parabola through the darkest channel and its two
+                                  neighbors, so it changes smoothly as the line moves between sensors
+                                  instead of stepping from one sensor to the next. The position is an
+                                  integer in thousandths of the sensor spacing, zero at the center of
+                                  the array and negative toward channel 0. No memory is allocated when
+                                  a position is found.
+   '''
+   
+    def __init__(self, num_sensors=8, lost_level=200):
+        '''!@brief                Initialize a line position object.
+            @param num_sensors    The number of line sensor channels
+            @param lost_level     The value which the darkest channel must pass for the line to be
+                                  seen. Below it, the line is treated as lost.
+        '''
+        self.num_sensors = num_sensors
+        self.lost_level = lost_level
+        # Position of the outermost channels
+        self.edge = (num_sensors - 1)*500
+        # Bit mask with one bit set for every channel
+        self.all_mask = (1 << num_sensors) - 1
+        # Create the state array holding the last position and whether the
+        # line is lost (1) or seen (0)
+        self.state = array('i', [0, 0])
+    
+    @_native
+    def update(self, values, saturated=0):
+        '''!@brief                Finds the line position from a set of line sensor values.
+            @details              Fits a parabola through the darkest channel and its neighbors
+                                  and returns the position of its peak. If several neighboring
+                                  channels share the darkest value, such as under a bar wider than
+                                  the spacing, the middle of those channels is returned instead.
+                                  A missing neighbor past the end of the array is taken as white.
+                                  If no channel sees the line, the last position is held, except
+                                  that a line last seen in the outer half of the array is taken to
+                                  be past that edge so the robot keeps turning toward it. If every
+                                  channel timed out, nothing is under the sensor that can be read,
+                                  such as when the robot is lifted or off the edge of the track,
+                                  so the line is treated as lost the same way.
+            @param values         An array('H') of 0-1000 values from LineSensorArray.normalize()
+            @param saturated      The mask of channels which timed out, from
+                                  LineSensorArray.saturated
+            @return               The line position in thousandths of the sensor spacing
+        '''
+        state = self.state
+        num_sensors = self.num_sensors
+        edge = self.edge
+        peak = _peak(values, num_sensors)
+        center = values[peak]
+        
+        # If the line is lost or can't be read, keep the last position, or go to
+        # the edge it was last seen near
+        if center < self.lost_level or saturated == self.all_mask:
+            position = state[0]
+            if position > edge//2:
+                position = edge
+            elif position < -edge//2:
+                position = -edge
+            state[0] = position
+            state[1] = 1
+            return position
+        
+        # Calibrated values stop at 1000, so a line wider than one channel reads
+        # as a flat run of equal values. Its position is the middle of the run.
+        last = peak
+        while last < num_sensors - 1 and values[last + 1] == center:
+            last += 1
+        if last > peak:
+            position = (peak + last)*500 - edge
+            state[0] = position
+            state[1] = 0
+            return position
+        
+        left = values[peak - 1] if peak > 0 else 0
+        right = values[peak + 1] if peak < num_sensors - 1 else 0
+        
+        # Offset of the peak of the parabola from the darkest channel, limited to half a spacing
+        curve = left - 2*center + right
+        offset = 0
+        if curve < 0:
+            offset = 500*(left - right)//curve
+            if offset > 500:
+                offset = 500
+            elif offset < -500:
+                offset = -500
+        
+        position = peak*1000 + offset - edge
+        state[0] = position
+        state[1] = 0
+        return position
+    
+    def lost(self):
+        '''!@brief                Checks if the line was lost on the most recent update.
+            @return               True if no channel saw the line or none could be read, False if
+                                  the line was seen
+        '''
+        return self.state[1] == 1
+
+if __name__ == "__main__":
+    # Compare the time taken by a weighted sum and by the line position for a
+    # typical set of values with the line between channels 4 and 5
+    values = array('H', [0, 0, 20, 80, 640, 710, 60, 0])
+    num_runs = 1000
+    
+    start = ticks_us()
+    for run in range(num_runs):
+        Centroid(values).weighted_sum()
+    sum_time = ticks_diff(ticks_us(), start)
+    
+    line_position = LinePosition()
+    start = ticks_us()
+    for run in range(num_runs):
+        line_position.update(values)
+    position_time = ticks_diff(ticks_us(), start)
+    
+    print(f"Weighted sum:  {Centroid(values).weighted_sum()}, {sum_time/num_runs:.1f} us per reading")
+    print(f"Line position: {line_position.update(values)}, {position_time/num_runs:.1f} us per reading")
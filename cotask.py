@@ -27,9 +27,36 @@
 #  ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
 #  POSSIBILITY OF SUCH DAMAGE.
 
-import gc                              # Memory allocation garbage collector
 import utime                           # Micropython version of time library
 import micropython                     # This shuts up incorrect warnings
+from array import array                # Preallocated arrays for statistics
+
+# Sleep until the next interrupt when no task is due; pyb.wfi() on the STM32
+# boards, or machine.idle() on other MicroPython ports
+try:
+    from pyb import wfi as _wait_for_interrupt
+    from pyb import disable_irq, enable_irq
+except ImportError:
+    from machine import idle as _wait_for_interrupt
+    from machine import disable_irq, enable_irq
+
+## The upper limits in microseconds of the bins of the release jitter 
+#  histogram kept for each task when a hardware timer releases the tasks. 
+#  The last bin holds every start later than the last limit.
+JITTER_BINS = (50, 100, 200, 500, 1000, 2000, 5000)
+
+## Overrun policy which runs a task once for every period it fell behind,
+#  back to back, keeping its original schedule
+CATCH_UP = 0
+## Overrun policy which drops the releases a task fell behind on and runs it
+#  once, then again at the next boundary of its original schedule
+SKIP = 1
+## Overrun policy which drops the releases a task fell behind on and runs it
+#  once, then one period after it was released, moving its schedule
+REBASE = 2
+
+## The bytes which start the binary dump of each task's trace
+TRACE_MAGIC = b'TRC1'
 
 
 ## Implements multitasking with scheduling and some performance logging.
@@ -81,12 +108,17 @@ class Task:
     #         The time can be given in a @c float or @c int; it will be 
     #         converted to microseconds for internal use by the scheduler.
     #  @param profile Set to @c True to enable run-time profiling 
-    #  @param trace Set to @c True to generate a list of transitions between
-    #         states. @b Note: This slows things down and allocates memory.
+    #  @param trace Set to @c True to record transitions between states in a
+    #         ring buffer which is allocated once, here
+    #  @param trace_size The number of transitions kept in the ring buffer; 
+    #         once it is full, the oldest transitions are overwritten
     #  @param shares A list or tuple of shares and queues used by this task.
     #         If no list is given, no shares are passed to the task
+    #  @param overrun What to do when the task falls a period or more behind:
+    #         @c CATCH_UP (default), @c SKIP, or @c REBASE
     def __init__(self, run_fun, name="NoName", priority=0, period=None,
-                 profile=False, trace=False, shares=()):
+                 profile=False, trace=False, shares=(), overrun=CATCH_UP,
+                 trace_size=256):
         # The function which is run to implement this task's code. Since it 
         # is a generator, we "run" it here, which doesn't actually run it but
         # gets it going as a generator which is ready to yield values
@@ -109,11 +141,37 @@ class Task:
         #  @c go() method. 
         if period != None:
             self.period = int(period * 1000)
-            self._next_run = utime.ticks_us() + self.period
+            self._next_run = utime.ticks_add(utime.ticks_us(), self.period)
         else:
             self.period = period
             self._next_run = None
 
+        ## The overrun policy, @c CATCH_UP, @c SKIP, or @c REBASE, used when
+        #  the task falls a period or more behind
+        self.overrun = overrun
+
+        # Variables used when a hardware timer releases the task: whether it
+        # does, the number of timer ticks in the period and until the next
+        # release, the time of the timer interrupt of the last release, 
+        # whether the next run should be measured from that release, and
+        # counts of releases and of runs started. The timer callback only 
+        # writes the count of releases and this task only writes the count 
+        # of runs, so neither can overwrite the other's change.
+        self._timer_driven = False
+        self._ticks = 0
+        self._countdown = 0
+        self._release_us = 0
+        self._jitter_pending = False
+        self._released = 0
+        self._started = 0
+
+        ## The shortest and longest time in microseconds from a timer release
+        #  to the start of a run and the number of runs measured, and a 
+        #  histogram of those times with bins limited by @c JITTER_BINS. They
+        #  are kept in arrays so that recording them doesn't allocate memory.
+        self.jitter = array('l', [0, 0, 0])
+        self.jitter_hist = array('H', (len(JITTER_BINS) + 1) * [0])
+
         # Flag which causes the task to be profiled, in which the execution
         #  time of the @c run() method is measured and basic statistics kept. 
         self._prof = profile
@@ -123,11 +181,21 @@ class Task:
         # for and track state transitions.
         self._prev_state = 0
 
-        # If transition tracing has been enabled, create an empty list in 
-        # which to store transition (time, to-state) stamps
+        # If transition tracing has been enabled, create the ring buffer of
+        # the times and to-states of the transitions. The times are from
+        # utime.ticks_us(), and states are kept as bytes. The index of the
+        # next entry, the number of entries, and the state the oldest entry
+        # was a transition from are kept as well.
         self._trace = trace
-        self._tr_data = []
-        self._prev_time = utime.ticks_us()
+        if trace:
+            self._tr_times = array('I', trace_size * [0])
+            self._tr_states = array('B', trace_size * [0])
+        else:
+            self._tr_times = array('I')
+            self._tr_states = array('B')
+        self._tr_next = 0
+        self._tr_count = 0
+        self._tr_first = 0
 
         ## Flag which is set true when the task is ready to be run by the
         #  scheduler
@@ -142,52 +210,71 @@ class Task:
     #  @return @c True if the task ran or @c False if it did not
     def schedule(self) -> bool:
         if self.ready():
-
-            # Reset the go flag for the next run
-            self.go_flag = False
-
-            # If profiling, save the start time
-            if self._prof:
-                stime = utime.ticks_us()
-
-            # Run the method belonging to the state which should be run next
-            curr_state = next(self._run_gen)
-
-            # If profiling or tracing, save timing data
-            if self._prof or self._trace:
-                etime = utime.ticks_us()
-
-            # If profiling, save timing data
-            if self._prof:
-                self._runs += 1
-                runt = utime.ticks_diff(etime, stime)
-                if self._runs > 2:
-                    self._run_sum += runt
-                    if runt > self._slowest:
-                        self._slowest = runt
-
-            # If transition logic tracing is on, record a transition; if not,
-            # ignore the state. If out of memory, switch tracing off and 
-            # run the memory allocation garbage collector
-            if self._trace:
-                try:
-                    if curr_state != self._prev_state:
-                        self._tr_data.append(
-                            (utime.ticks_diff(etime, self._prev_time),
-                             curr_state))
-                except MemoryError:
-                    self._trace = False
-                    gc.collect()
-
-                self._prev_state = curr_state
-                self._prev_time = etime
-
+            self.run()
             return True
 
         else:
             return False
 
 
+    ## This method runs the task's generator up to the next @c yield() and 
+    #  records profiling and trace data, without checking if the task is
+    #  ready. It is called by @c schedule() and by schedulers such as 
+    #  @c TaskList.edf_sched() which have already decided the task should run.
+    def run(self):
+        # Count the run of a timer release before resetting the go flag, so
+        # a release which comes in between isn't lost
+        if self._timer_driven and self._started != self._released:
+            self._started = (self._started + 1) & 0xFFFF
+
+        # Reset the go flag for the next run
+        self.go_flag = False
+
+        # If this run is for a new timer release, it is measured from that
+        # release; runs started by go() or to catch up on older releases
+        # aren't measured
+        measure = self._jitter_pending
+        if measure:
+            self._jitter_pending = False
+
+        # If profiling or measuring the release jitter, save the start time
+        if self._prof or measure:
+            stime = utime.ticks_us()
+
+        # Record how late the run starts after the timer interrupt
+        if measure:
+            self._record_jitter(utime.ticks_diff(stime, self._release_us))
+
+        # Run the method belonging to the state which should be run next
+        curr_state = next(self._run_gen)
+
+        # If profiling or tracing, save timing data
+        if self._prof or self._trace:
+            etime = utime.ticks_us()
+
+        # If profiling, save timing data
+        if self._prof:
+            self._runs += 1
+            runt = utime.ticks_diff(etime, stime)
+            if self._runs > 2:
+                self._run_sum += runt
+                if runt > self._slowest:
+                    self._slowest = runt
+
+        # If transition logic tracing is on, record a transition; if not,
+        # ignore the state. Entries are written into the ring buffer, so 
+        # no memory is allocated
+        if self._trace:
+            if curr_state != self._prev_state:
+                self._record_transition(etime, curr_state)
+            self._prev_state = curr_state
+
+        # If the timer has released the task again, or it is catching up on
+        # releases, stay ready to run
+        if self._timer_driven and self._released != self._started:
+            self.go_flag = True
+
+
     ## This method checks if the task is ready to run.
     #  If the task runs on a timer, this method checks what time it is; if not,
     #  this method checks the flag which indicates that the task is ready to
@@ -196,27 +283,119 @@ class Task:
     @micropython.native
     def ready(self) -> bool:
         # If this task uses a timer, check if it's time to run run() again. If
-        # so, set go flag and set the timer to go off at the next run time
-        if self.period != None:
+        # so, set go flag and set the timer to go off at the next run time.
+        # A task released by a hardware timer only needs its go flag checked.
+        if self.period != None and not self._timer_driven:
             late = utime.ticks_diff(utime.ticks_us(), self._next_run)
             if late > 0:
-                self.go_flag = True
-                self._next_run = utime.ticks_diff(self.period, 
-                                                  -self._next_run)
-
-                # If keeping a latency profile, record the data
-                if self._prof:
-                    self._late_sum += late
-                    if late > self._latest:
-                        self._latest = late
+                self.release(late)
 
         # If the task doesn't use a timer, we rely on go_flag to signal ready
         return self.go_flag
 
 
+    ## This method releases a timed task which has reached its run time. It
+    #  sets the go flag, sets the timer to go off at the next run time, and
+    #  records how late the task was released. If the task is a period or 
+    #  more late, the next run time is set by its overrun policy: one period
+    #  later for @c CATCH_UP, so the missed runs follow back to back; the 
+    #  next boundary of the schedule for @c SKIP; or one period from now for
+    #  @c REBASE. The runs dropped by @c SKIP and @c REBASE are counted.
+    #  @param late The time in microseconds since the task's run time
+    @micropython.native
+    def release(self, late):
+        self.go_flag = True
+        period = self.period
+        if period and late >= period and self.overrun != CATCH_UP:
+            missed = late // period
+            self._skips += missed
+            if self.overrun == SKIP:
+                self._next_run = utime.ticks_add(self._next_run, 
+                                                 (missed + 1) * period)
+            else:
+                self._next_run = utime.ticks_add(self._next_run, 
+                                                 late + period)
+        else:
+            self._next_run = utime.ticks_add(self._next_run, period)
+
+        # If keeping a latency profile, record the data
+        if self._prof:
+            self._late_sum += late
+            if late > self._latest:
+                self._latest = late
+
+
+    ## This method records a state transition in the trace ring buffer. 
+    #  When the buffer is full, the oldest entry is overwritten, and the 
+    #  state it was a transition to becomes the from-state of the new oldest.
+    #  @param time The time of the transition from @c utime.ticks_us()
+    #  @param state The state the task went to
+    @micropython.native
+    def _record_transition(self, time, state):
+        index = self._tr_next
+        size = len(self._tr_times)
+        if self._tr_count < size:
+            if self._tr_count == 0:
+                self._tr_first = self._prev_state & 0xFF
+            self._tr_count += 1
+        else:
+            self._tr_first = self._tr_states[index]
+        self._tr_times[index] = time
+        self._tr_states[index] = state & 0xFF
+        index += 1
+        if index >= size:
+            index = 0
+        self._tr_next = index
+
+
+    ## This method records how late a run started after the timer interrupt
+    #  which released the task, in the jitter arrays and, if profiling, in
+    #  the lateness columns of the profile.
+    #  @param late The time in microseconds from the release to the start
+    @micropython.native
+    def _record_jitter(self, late):
+        jitter = self.jitter
+        hist = self.jitter_hist
+        if jitter[2] == 0:
+            jitter[0] = late
+            jitter[1] = late
+        elif late < jitter[0]:
+            jitter[0] = late
+        elif late > jitter[1]:
+            jitter[1] = late
+        if jitter[2] < 0x3FFFFFFF:
+            jitter[2] += 1
+
+        # Find the bin of the histogram, which stops counting at its limit
+        index = 0
+        for limit in JITTER_BINS:
+            if late < limit:
+                break
+            index += 1
+        if hist[index] < 0xFFFF:
+            hist[index] += 1
+
+        if self._prof:
+            self._late_sum += late
+            if late > self._latest:
+                self._latest = late
+
+
+    ## This method releases a task at a tick of the hardware timer used by
+    #  @c TaskList.start_timer(). It sets the go flag and records the time of
+    #  the release, so the next run's start is measured from it.
+    #  @param release_us The time of the release from @c utime.ticks_us()
+    def timer_release(self, release_us):
+        self._release_us = release_us
+        self._jitter_pending = True
+        self.go_flag = True
+
+
     ## This method sets the period between runs of the task to the given
     #  number of milliseconds, or @c None if the task is triggered by calls
-    #  to @c go() rather than time.
+    #  to @c go() rather than time. If the task list is run by 
+    #  @c TaskList.edf_sched(), @c TaskList.rebuild_heaps() must be called
+    #  after the period is changed.
     #  @param new_period The new period in milliseconds between task runs
     def set_period(self, new_period):
         if new_period is None:
@@ -233,28 +412,90 @@ class Task:
         self._slowest = 0
         self._late_sum = 0
         self._latest = 0
+        self._skips = 0
+        self.jitter[2] = 0
+        for index in range(len(self.jitter_hist)):
+            self.jitter_hist[index] = 0
 
 
     ## This method returns a string containing the task's transition trace.
-    #  The trace is a set of tuples, each of which contains a time and the
-    #  states from and to which the system transitioned. 
+    #  Each line shows the time since the oldest transition kept in the ring
+    #  buffer and the states from and to which the system transitioned. 
     #  @return A possibly quite large string showing state transitions
     def get_trace(self):
         tr_str = 'Task ' + self.name + ':'
         if self._trace:
             tr_str += '\n'
-            last_state = 0
-            total_time = 0.0
-            for item in self._tr_data:
-                total_time += item[0] / 1000000.0
-                tr_str += '{: 12.6f}: {: 2d} -> {:d}\n'.format (total_time, 
-                    last_state, item[1])
-                last_state = item[1]
+            size = len(self._tr_times)
+            index = (self._tr_next - self._tr_count) % size
+            start = self._tr_times[index]
+            last_state = self._tr_first
+            for entry in range(self._tr_count):
+                elapsed = utime.ticks_diff(self._tr_times[index], start)
+                state = self._tr_states[index]
+                tr_str += '{: 12.6f}: {: 2d} -> {:d}\n'.format (
+                    elapsed / 1000000.0, last_state, state)
+                last_state = state
+                index += 1
+                if index >= size:
+                    index = 0
         else:
             tr_str += ' not traced'
         return tr_str
 
 
+    ## This method writes the task's transition trace to a stream, such as a
+    #  UART, in a compact binary form. The dump is @c TRACE_MAGIC; the length
+    #  of the task name and the name; the number of entries and the state 
+    #  the oldest entry was a transition from, as a little-endian 16 bit and
+    #  8 bit number; the entries' 32 bit times from @c utime.ticks_us(); 
+    #  and the entries' 8 bit to-states, oldest first. The arrays are written
+    #  from memory, so the dump doesn't copy them.
+    #  @param stream The stream with a @c write() method to write to
+    def dump_trace(self, stream):
+        name = self.name.encode()
+        count = self._tr_count
+        stream.write(TRACE_MAGIC)
+        stream.write(bytes((len(name),)) + name)
+        stream.write(bytes((count & 0xFF, count >> 8, self._tr_first)))
+        if count == 0:
+            return
+        # Write the older part from the next index to the end, then the rest
+        size = len(self._tr_times)
+        oldest = (self._tr_next - count) % size
+        times = memoryview(self._tr_times)
+        states = memoryview(self._tr_states)
+        if oldest + count <= size:
+            stream.write(times[oldest:oldest + count])
+            stream.write(states[oldest:oldest + count])
+        else:
+            stream.write(times[oldest:])
+            stream.write(times[:self._tr_next])
+            stream.write(states[oldest:])
+            stream.write(states[:self._tr_next])
+
+
+    ## This method returns a string containing the task's release jitter, 
+    #  the spread of the times from the timer releases to the starts of the
+    #  runs, and the histogram of those times.
+    #  @return A string showing the release jitter statistics
+    def get_jitter(self):
+        jit_str = 'Task ' + self.name + ':'
+        if self.jitter[2] == 0:
+            return jit_str + ' not released by a timer'
+        jit_str += (f" start {self.jitter[0]}-{self.jitter[1]} us after "
+                    f"release, jitter {self.jitter[1] - self.jitter[0]} us\n")
+        lower = 0
+        for index in range(len(self.jitter_hist)):
+            if index < len(JITTER_BINS):
+                jit_str += f"{lower: 8d}-{JITTER_BINS[index]:<6d} us"
+                lower = JITTER_BINS[index]
+            else:
+                jit_str += f"{lower: 8d}+       us"
+            jit_str += f"{self.jitter_hist[index]: 8d}\n"
+        return jit_str
+
+
     ## Method to set a flag so that this task indicates that it's ready to run.
     #  This method may be called from an interrupt service routine or from
     #  another task which has data that this task needs to process soon.
@@ -280,11 +521,59 @@ class Task:
             rst += f"{avg_dur: 10.3f}{(self._slowest / 1000.0): 10.3f}"
             if self.period != None:
                 rst += f"{avg_late: 10.3f}{(self._latest / 1000.0): 10.3f}"
+                rst += f"{self._skips: 8d}"
         return rst
 
 
 # =============================================================================
 
+## Push a task onto a heap of tasks ordered by their next run times.
+#  The heap is a Python list in which each task's @c _next_run is no later
+#  than those of its two children. Times are compared with 
+#  @c utime.ticks_diff() so the order stays correct when the microsecond
+#  timer wraps around.
+#  @param heap The list which holds the heap
+#  @param task The task to be added to the heap
+@micropython.native
+def _heap_push(heap, task):
+    heap.append(task)
+    child = len(heap) - 1
+    key = task._next_run
+    while child > 0:
+        parent = (child - 1) >> 1
+        if utime.ticks_diff(key, heap[parent]._next_run) >= 0:
+            break
+        heap[child] = heap[parent]
+        child = parent
+    heap[child] = task
+
+
+## Remove and return the task with the earliest next run time from a heap.
+#  @param heap The list which holds the heap, which must not be empty
+#  @return The task with the earliest next run time
+@micropython.native
+def _heap_pop(heap):
+    first = heap[0]
+    last = heap.pop()
+    length = len(heap)
+    if length > 0:
+        key = last._next_run
+        parent = 0
+        child = 1
+        while child < length:
+            # Move down toward the earlier of the two children
+            if child + 1 < length and utime.ticks_diff(
+                    heap[child + 1]._next_run, heap[child]._next_run) < 0:
+                child += 1
+            if utime.ticks_diff(heap[child]._next_run, key) >= 0:
+                break
+            heap[parent] = heap[child]
+            parent = child
+            child = 2 * parent + 1
+        heap[parent] = last
+    return first
+
+
 ## A list of tasks used internally by the task scheduler.
 #  This class holds the list of tasks which will be run by the task scheduler.
 #  The task list is usually not directly used by the programmer except when
@@ -295,7 +584,8 @@ class Task:
 #  The task list is sorted by priority so that the scheduler can efficiently
 #  look through the list to find the highest priority task which is ready to
 #  run at any given time. Tasks can also be scheduled in a simpler
-#  "round-robin" fashion.
+#  "round-robin" fashion, or earliest-deadline-first, in which the tasks
+#  which run on a timer are also kept in heaps ordered by their run times.
 class TaskList:
 
     ## Initialize the task list. This creates the list of priorities in
@@ -308,6 +598,42 @@ class TaskList:
         #  that priority. 
         self.pri_list = []
 
+        # Heaps used by the earliest-deadline-first scheduler. Timed tasks
+        # wait in the pending heap, ordered by when they are next released;
+        # released tasks wait in the ready heap, ordered by their deadlines.
+        # Tasks with no period are kept in a plain list and run when their
+        # go flags are set.
+        self._pending = []
+        self._ready = []
+        self._triggered = []
+
+        # Flag set when the run times of the tasks may have been changed 
+        # outside the heaps, by the other schedulers or the hardware timer, 
+        # so the heaps must be rebuilt before they are used again
+        self._heaps_stale = False
+
+        ## The shortest time in microseconds until the next task is due for
+        #  which @c idle() sleeps. The 1 ms SysTick interrupt ends each sleep,
+        #  so a sleep starting more than about 1 ms before the next run time
+        #  always ends before it and doesn't make the task late.
+        self.min_sleep_us = 1100
+        self.reset_idle()
+
+        # Variables used when a hardware timer releases the tasks: the timer,
+        # the tasks it releases, the number of timer interrupts and of ticks
+        # handled, the time of the last interrupt, and whether a call of
+        # _tick() has already been scheduled
+        self._timer = None
+        self._tick_period = 1000
+        self._timed_tasks = ()
+        self._isr_ticks = 0
+        self._done_ticks = 0
+        self._tick_us = 0
+        self._tick_queued = False
+        ## The number of timer ticks which passed before they were handled,
+        #  because a task ran for longer than one tick
+        self.late_ticks = 0
+
 
     ## Append a task to the task list. The list will be sorted by task 
     #  priorities so that the scheduler can quickly find the highest priority
@@ -333,6 +659,12 @@ class TaskList:
         # Make sure the main list (of lists at each priority) is sorted
         self.pri_list.sort(key=lambda pri: pri[0], reverse=True)
 
+        # Add the task to the heaps for earliest-deadline-first scheduling
+        if task.period is None:
+            self._triggered.append(task)
+        else:
+            _heap_push(self._pending, task)
+
 
     ## Run tasks in order, ignoring the tasks' priorities.
     #
@@ -343,12 +675,19 @@ class TaskList:
     #  tasks are given a chance to run each time through the list, and it takes
     #  about the same amount of time before each is given a chance to run 
     #  again.
+    #  @return @c True if any task ran or @c False if no task was ready
     @micropython.native
-    def rr_sched(self):
+    def rr_sched(self) -> bool:
+        # The tasks' run times are moved outside the EDF heaps
+        self._heaps_stale = True
+
         # For each priority level, run all tasks at that level
+        ran = False
         for pri in self.pri_list:
             for task in pri[2:]:
-                task.schedule()
+                if task.schedule():
+                    ran = True
+        return ran
 
 
     ## Run tasks according to their priorities.
@@ -356,8 +695,12 @@ class TaskList:
     #  This scheduler runs tasks in a priority based fashion. Each time it is
     #  called, it finds the highest priority task which is ready to run and
     #  calls that task's @c run() method.
+    #  @return @c True if a task ran or @c False if no task was ready
     @micropython.native
-    def pri_sched(self):
+    def pri_sched(self) -> bool:
+        # The tasks' run times are moved outside the EDF heaps
+        self._heaps_stale = True
+
         # Go down the list of priorities, beginning with the highest
         for pri in self.pri_list:
             # Within each priority list, run tasks in round-robin order
@@ -372,16 +715,293 @@ class TaskList:
                 if pri[1] >= length:
                     pri[1] = 2
                 if ran:
-                    return
+                    return True
+        return False
+
+
+    ## Run tasks in earliest-deadline-first order, ignoring their priorities.
+    #
+    #  This scheduler checks the time once per call. Each timed task whose
+    #  run time has passed is moved from the pending heap to the ready heap,
+    #  where it is ordered by its deadline, the end of its current period. 
+    #  A task with no period whose go flag is set runs first; otherwise the 
+    #  ready task with the earliest deadline runs and then goes back to the 
+    #  pending heap. Finding the next task takes O(log n) time, and a call 
+    #  when no task is due only compares the time with the earliest run time.
+    #
+    #  The heaps are ordered by each task's @c _next_run, so they are rebuilt
+    #  here if anything else has changed the run times since the last call:
+    #  @c pri_sched(), @c rr_sched(), @c start_timer(), and @c stop_timer()
+    #  mark them out of date. Calling a task's @c schedule(), @c ready(), or
+    #  @c release() directly, or changing its period with @c set_period(), 
+    #  also changes its run time, so @c rebuild_heaps() must be called after
+    #  doing so. This scheduler can't be used while a hardware timer started
+    #  by @c start_timer() releases the tasks.
+    #  @return @c True if a task ran or @c False if no task was ready
+    @micropython.native
+    def edf_sched(self) -> bool:
+        if self._heaps_stale:
+            if self._timer is not None:
+                raise RuntimeError("edf_sched() can't be used while a timer "
+                                   "releases the tasks")
+            self.rebuild_heaps()
+
+        pending = self._pending
+        ready = self._ready
+        now = utime.ticks_us()
+
+        # Release every timed task whose run time has passed
+        while pending:
+            late = utime.ticks_diff(now, pending[0]._next_run)
+            if late <= 0:
+                break
+            task = _heap_pop(pending)
+            task.release(late)
+            _heap_push(ready, task)
+
+        for task in self._triggered:
+            if task.go_flag:
+                task.run()
+                return True
+
+        if ready:
+            task = _heap_pop(ready)
+            task.run()
+            _heap_push(pending, task)
+            return True
+        return False
+
+
+    ## Release the timed tasks from a hardware timer instead of the clock.
+    #
+    #  The timer interrupt only records the time and uses 
+    #  @c micropython.schedule() to call @c _tick(), which counts down the
+    #  ticks until each task's release and sets its go flag at the exact
+    #  period boundary. Each task's period must be a whole number of ticks.
+    #  The time from the interrupt to the start of each run is kept in the
+    #  task's jitter arrays and the lateness columns of the profile. The 
+    #  tasks are run by @c pri_sched() or @c rr_sched() as usual, and 
+    #  @c idle() sleeps until the timer interrupt wakes the CPU.
+    #  @param timer A @c pyb.Timer running at the tick rate
+    #  @param tick_us The time in microseconds between timer interrupts
+    def start_timer(self, timer, tick_us=1000):
+        tasks = []
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                if task.period is not None:
+                    if task.period % tick_us != 0:
+                        raise ValueError(f"Period of {task.name} isn't a "
+                                         f"multiple of {tick_us} us")
+                    task._ticks = task.period // tick_us
+                    task._countdown = task._ticks
+                    task._released = task._started
+                    task._timer_driven = True
+                    tasks.append(task)
+        self._timed_tasks = tuple(tasks)
+        self._timer = timer
+        self._heaps_stale = True
+        self._tick_period = tick_us
+
+        # Bind the callbacks once so that the interrupt doesn't allocate memory
+        self._tick_cb = self._tick
+        self._isr_cb = self._timer_isr
+        micropython.alloc_emergency_exception_buf(100)
+        timer.callback(self._isr_cb)
+
+
+    ## Stop releasing the tasks from the hardware timer and go back to 
+    #  checking their run times against the clock.
+    def stop_timer(self):
+        if self._timer is not None:
+            self._timer.callback(None)
+            self._timer = None
+        now = utime.ticks_us()
+        for task in self._timed_tasks:
+            task._timer_driven = False
+            task._next_run = utime.ticks_add(now, task.period)
+        self._heaps_stale = True
+
+
+    ## The timer interrupt callback. It counts the tick, records the time, 
+    #  and schedules @c _tick() if it isn't already waiting to run. It only
+    #  changes small integers, so it doesn't allocate memory.
+    #  @param tim The timer which called this method
+    def _timer_isr(self, tim):
+        self._isr_ticks = (self._isr_ticks + 1) & 0xFFFF
+        self._tick_us = utime.ticks_us()
+        if not self._tick_queued:
+            self._tick_queued = True
+            micropython.schedule(self._tick_cb, 0)
+
+
+    ## Count down the ticks of each task and release the tasks whose periods
+    #  have ended. If more than one tick has passed since the last call, all
+    #  of them are counted. A task which passed more than one period 
+    #  boundary, or hasn't started the run of its last release, has overrun
+    #  and is handled by its overrun policy: @c CATCH_UP counts a release 
+    #  for every boundary so the task runs that many times, @c SKIP releases
+    #  it once at its latest boundary, and @c REBASE releases it once and 
+    #  starts its next period at this tick. The releases dropped by @c SKIP 
+    #  and @c REBASE are counted.
+    #  @param arg The argument from @c micropython.schedule(), not used
+    def _tick(self, arg):
+        self._tick_queued = False
+        isr_ticks = self._isr_ticks
+        ticks = (isr_ticks - self._done_ticks) & 0xFFFF
+        self._done_ticks = isr_ticks
+        if ticks > 1:
+            self.late_ticks += ticks - 1
+        for task in self._timed_tasks:
+            countdown = task._countdown - ticks
+            if countdown <= 0:
+                period_ticks = task._ticks
+                # Count the boundaries passed after the first one
+                missed = -countdown // period_ticks
+                countdown += (missed + 1) * period_ticks
+                if task.overrun == CATCH_UP:
+                    task._released = (task._released + missed + 1) & 0xFFFF
+                else:
+                    # A release which hasn't started yet absorbs this one
+                    if task._released != task._started:
+                        missed += 1
+                    else:
+                        task._released = (task._released + 1) & 0xFFFF
+                    task._skips += missed
+                    if missed and task.overrun == REBASE:
+                        countdown = period_ticks
+                # Release the task at the time of the tick at its latest
+                # period boundary
+                task.timer_release(utime.ticks_add(self._tick_us, 
+                    (countdown - period_ticks) * self._tick_period))
+            task._countdown = countdown
+
+
+    ## Create a string showing the release jitter of the tasks released by
+    #  the hardware timer.
+    #  @return The release jitter of each task
+    def get_jitter(self):
+        jit_str = f"Late timer ticks: {self.late_ticks}\n"
+        for task in self._timed_tasks:
+            jit_str += task.get_jitter() + '\n'
+        return jit_str
+
+
+    ## Find the time until the next task is due to run.
+    #  @return The time in microseconds until the earliest run time of the 
+    #          timed tasks, which is negative if a task is already late, or 
+    #          0 if a task's go flag is set. If there are no timed tasks,
+    #          @c None is returned.
+    def time_to_next(self):
+        now = utime.ticks_us()
+        wait = None
+        for pri in self.pri_list:
+            # Index the list in place so no slice is allocated with the
+            # interrupts disabled
+            for index in range(2, len(pri)):
+                task = pri[index]
+                if task.go_flag:
+                    return 0
+                # The timer interrupt wakes the CPU for timer released tasks
+                if task.period is not None and not task._timer_driven:
+                    until = utime.ticks_diff(task._next_run, now)
+                    if wait is None or until < wait:
+                        wait = until
+        return wait
+
+
+    ## Sleep until the next interrupt if no task is due soon.
+    #
+    #  This method is called by the main loop when the scheduler didn't run
+    #  a task. If the next task isn't due for at least @c min_sleep_us, the
+    #  CPU sleeps with @c pyb.wfi() until the next interrupt instead of 
+    #  polling the time. The 1 ms SysTick wakes it before the task is due, 
+    #  and an interrupt which calls a task's @c go() method wakes it at once.
+    #  The time until the next task is checked with interrupts disabled, so
+    #  an interrupt which comes after the check still ends the sleep at once.
+    #  The time spent asleep is added up for @c idle_percent().
+    #  @b Example:
+    #    @code
+    #       while True:
+    #           if not cotask.task_list.pri_sched():
+    #               cotask.task_list.idle()
+    #    @endcode
+    #  @return @c True if the CPU slept or @c False if it did not
+    def idle(self) -> bool:
+        irq_state = disable_irq()
+        wait = self.time_to_next()
+        if wait is not None and wait < self.min_sleep_us:
+            enable_irq(irq_state)
+            return False
+        stime = utime.ticks_us()
+        _wait_for_interrupt()
+        # The interrupt which woke the CPU is handled once they're enabled
+        enable_irq(irq_state)
+        self._idle_us += utime.ticks_diff(utime.ticks_us(), stime)
+        if self._idle_us >= 1000:
+            self._idle_ms += self._idle_us // 1000
+            self._idle_us %= 1000
+        self._sleeps += 1
+        return True
+
+
+    ## Reset the time asleep and the start of the time over which
+    #  @c idle_percent() is found. This method is also used by @c __init__()
+    #  to create the variables.
+    def reset_idle(self):
+        self._idle_start = utime.ticks_ms()
+        self._idle_ms = 0
+        self._idle_us = 0
+        self._sleeps = 0
+
+
+    ## Find the percentage of time the CPU has slept in @c idle().
+    #  @return The percentage of the time since @c reset_idle() was called
+    #          which was spent asleep
+    def idle_percent(self):
+        elapsed = utime.ticks_diff(utime.ticks_ms(), self._idle_start)
+        if elapsed <= 0:
+            return 0.0
+        return 100.0 * self._idle_ms / elapsed
+
+
+    ## Write the transition traces of all the traced tasks to a stream, such
+    #  as a UART, in the binary form written by @c Task.dump_trace().
+    #  @param stream The stream with a @c write() method to write to
+    def dump_traces(self, stream):
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                if task._trace:
+                    task.dump_trace(stream)
+
+
+    ## Rebuild the heaps used by @c edf_sched() from the tasks' current run
+    #  times, periods, and go flags. Timed tasks whose go flags are set have
+    #  been released and go in the ready heap; the other timed tasks go in 
+    #  the pending heap.
+    def rebuild_heaps(self):
+        self._pending = []
+        self._ready = []
+        self._triggered = []
+        for pri in self.pri_list:
+            for index in range(2, len(pri)):
+                task = pri[index]
+                if task.period is None:
+                    self._triggered.append(task)
+                elif task.go_flag:
+                    _heap_push(self._ready, task)
+                else:
+                    _heap_push(self._pending, task)
+        self._heaps_stale = False
 
 
     ## Create some diagnostic text showing the tasks in the task list.
     def __repr__(self):
         ret_str = 'TASK             PRI    PERIOD    RUNS   AVG DUR   MAX ' \
-            'DUR  AVG LATE  MAX LATE\n'
+            'DUR  AVG LATE  MAX LATE   SKIPS\n'
         for pri in self.pri_list:
             for task in pri[2:]:
                 ret_str += str(task) + '\n'
+        ret_str += f"Idle {self.idle_percent():.1f}% in {self._sleeps} sleeps\n"
 
         return ret_str
 
@@ -391,5 +1011,41 @@ class TaskList:
 task_list = TaskList()
 
 
+# =============================================================================
+
+## Benchmark of the dispatch overhead of the three schedulers.
+#  When this file is run on the Nucleo, it times each scheduler running 
+#  2 to 16 tasks which do nothing, first with every task always due, to find
+#  the time taken to choose and run each task, and then with no task due,
+#  to find the time taken by a call which runs nothing.
+if __name__ == "__main__":
+
+    def _idle_fun():
+        while True:
+            yield 0
 
+    def _bench(sched_name, num_tasks, period):
+        tlist = TaskList()
+        for num in range(num_tasks):
+            tlist.append(Task(_idle_fun, name=str(num), priority=num % 3,
+                              period=period))
+        sched = getattr(tlist, sched_name)
+        num_calls = 2000
+        stime = utime.ticks_us()
+        for call in range(num_calls):
+            sched()
+        return utime.ticks_diff(utime.ticks_us(), stime) / num_calls
 
+    print('TASKS  SCHEDULER   BUSY us/call  IDLE us/call')
+    for num_tasks in (2, 4, 8, 16):
+        for sched_name in ('pri_sched', 'rr_sched', 'edf_sched'):
+            # A period of 1 us makes every task due on every call, and a
+            # period of 100 s makes no task due. Longer periods don't fit in
+            # the range of utime.ticks_add().
+            busy = _bench(sched_name, num_tasks, 0.001)
+            idle = _bench(sched_name, num_tasks, 100_000)
+            if sched_name == 'rr_sched':
+                # The round-robin scheduler runs every due task in each call
+                busy /= num_tasks
+            print(f"{num_tasks: 5d}  {sched_name:<10s}{busy: 14.1f}"
+                  f"{idle: 14.1f}")
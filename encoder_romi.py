@@ -7,13 +7,46 @@
 '''
 from pyb import Timer
 
+# The code emitters are only available in MicroPython, and only in ports built
+# with the viper emitter. Elsewhere, such as on a host, the count difference
+# is found with plain Python instead.
+try:
+    import micropython
+except ImportError:
+    micropython = None
+
+if hasattr(micropython, 'viper'):
+    @micropython.viper
+    def _wrap_delta(count_new: int, count_old: int) -> int:
+        '''!@brief              Finds the change between two 16 bit counts.
+            @details            Masks the difference to 16 bits and sign extends it, so a rollover in
+                                either direction gives the right delta without any comparisons with
+                                the auto-reload value.
+            @param count_new    The new timer count
+            @param count_old    The old timer count
+            @return             The signed change in counts
+        '''
+        delta = (count_new - count_old) & 0xFFFF
+        if delta & 0x8000:
+            delta -= 0x10000
+        return delta
+else:
+    def _wrap_delta(count_new, count_old):
+        delta = (count_new - count_old) & 0xFFFF
+        if delta & 0x8000:
+            delta -= 0x10000
+        return delta
+
 class Encoder_romi:
     '''@brief                     Interface with qudrature econders
        @details                   The object is initialized, has an update method
                                   that updates all the necessary values, a get_position method
                                   that returns the position of the encoder, a get_delta method
-                                  that reutrns the delta from the last call of update, a zero
-                                  method that zeros the position of the encoder.
+                                  that reutrns the delta from the last call of update, and a zero
+                                  method that zeros the position of the encoder. The velocity is
+                                  found from the positions by the VelEstimator class. The timer
+                                  counter is 16 bits, so rollover is handled with integer masking
+                                  and no floats are created when the encoder is updated.
     '''
     
     def __init__(self, EN_tim, CH_A_Pin, CH_B_Pin):
@@ -22,6 +55,7 @@ class Encoder_romi:
                                   to the self variable, sets the pins of the encoder timer from the given
                                   arguments, and sets the counter as the counter of the encoder timer. It
                                   also sets the autoreload value and sets the position and old count to 0.
+                                  The timer must have a period of 65535 for the 16 bit rollover handling.
             @param EN_tim         A timer object to use for the encoder object
             @param CH_A_Pin       A pin object to be assigned to channel 1 of the encoder object
             @param CH_B_Pin       A pin object to be assigned to channel 2 of the encoder object
@@ -32,8 +66,9 @@ class Encoder_romi:
         self.EN2 = EN_tim.channel(2, pin=CH_B_Pin, mode=Timer.ENC_AB)
         self.EN_counter = EN_tim.counter()
         self.AR = 65535
-        self.postion = 0
+        self.position = 0
         self.count_old = 0
+        self.delta = 0
         
     def update(self):
         '''!@brief              Updates encoder position and delta
@@ -42,18 +77,20 @@ class Encoder_romi:
                                 also updates delta properly if rollover has occurred in either direction.
                                 It then adds the delta to the position to update the position.
         '''
-        # Read the new count, calculate delta, and reset the old count
-        self.count_new = self.EN_tim.counter()
-        self.delta = self.count_new - self.count_old
-        self.count_old = self.count_new
-        # Update delta if rollover has occurred
-        if self.delta > ((self.AR+1)/2):
-            self.delta = self.delta - (self.AR+1)
-        if self.delta < (-(self.AR+1)/2):
-            self.delta = self.delta + (self.AR+1)
-        self.position += self.delta
-        
-
+        self.update_count(self.EN_tim.counter())
+    
+    def update_count(self, count_new):
+        '''!@brief              Updates encoder position and delta from a count read earlier
+            @details            Works like update(), but uses a count which has already been read from the
+                                timer, such as one latched by a timer interrupt, instead of reading it now.
+            @param count_new    The timer count
+        '''
+        # Calculate delta with rollover handled, and reset the old count
+        delta = _wrap_delta(count_new, self.count_old)
+        self.count_old = count_new
+        self.delta = delta
+        self.position += delta
+    
     def get_position(self):
         '''!@brief              Gets the most recent encoder position
             @details            The method simply returns the position when the method is called.
@@ -70,6 +107,9 @@ class Encoder_romi:
 
     def zero(self):
         '''!@brief             Resets the encoder position to zero
-            @details           Sets the position variable to zero when called.
+            @details           Sets the position variable to zero when called, and sets the old count
+                               to the current count so the next update doesn't add the counts from
+                               before the encoder was zeroed.
         '''
-        self.position = 0
\ No newline at end of file
+        self.position = 0
+        self.count_old = self.EN_tim.counter()
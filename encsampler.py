@@ -0,0 +1,127 @@
+'''!@file                          encsampler.py
+    @brief                         A class to sample both encoders from a timer interrupt.
+    @details                       A class that uses a hardware timer callback to latch the counts
+                                   of both encoder timers at an exact rate, along with the time of
+                                   each sample, into preallocated ring buffers. The wheel tasks use
+                                   the latched counts and the true time between samples, so the
+                                   velocity and the integral of the PI controllers don't depend on
+                                   when the scheduler happens to run the tasks. The sampler also
+                                   measures how much the interrupt and the tasks are delayed.
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+from array import array
+from time import ticks_us, ticks_diff
+
+## Index of the left encoder count in a latched sample
+COUNT_L = 0
+## Index of the right encoder count in a latched sample
+COUNT_R = 1
+## Index of the time of the sample, from ticks_us(), in a latched sample
+SAMPLE_TIME = 2
+## Index of the sequence number of the sample in a latched sample
+SAMPLE_SEQ = 3
+
+class EncSampler:
+    '''!@brief                          A class to latch both encoder counts from a timer interrupt.
+        @details                        Objects of this class are given a timer running at the sampling rate
+                                        and the two encoder timers. Once started, the timer callback reads
+                                        both counters and the time into the next slot of the ring buffers.
+                                        A task copies the newest sample with latest(). The callback only
+                                        stores small integers into existing arrays, so it doesn't allocate
+                                        memory.
+    '''
+
+    def __init__(self, timer, enc_tim_L, enc_tim_R, size=8):
+        '''!@brief                      Creates an object of the EncSampler class.
+            @param timer                A pyb.Timer set to the sampling rate
+            @param enc_tim_L            The encoder timer of the left wheel
+            @param enc_tim_R            The encoder timer of the right wheel
+            @param size                 The number of samples kept in the ring buffers
+        '''
+        self.timer = timer
+        self.enc_tim_L = enc_tim_L
+        self.enc_tim_R = enc_tim_R
+        self.size = size
+        # Create the ring buffers of latched counts and sample times
+        self.counts_L = array('H', size*[0])
+        self.counts_R = array('H', size*[0])
+        self.times = array('l', size*[0])
+        self.newest = 0
+        self.seq = 0
+        # Create the statistics of the shortest and longest time between interrupts
+        # and the longest time from a sample until a task used it, in microseconds
+        self.min_interval = 0x3FFFFFFF
+        self.max_interval = 0
+        self.max_age = 0
+        # Bind the callback once so that starting the sampler doesn't allocate memory
+        self.timer_cb = self.timer_callback
+
+    def start(self):
+        '''!@brief                      Starts sampling the encoders.
+        '''
+        self.timer.callback(self.timer_cb)
+
+    def stop(self):
+        '''!@brief                      Stops sampling the encoders.
+        '''
+        self.timer.callback(None)
+
+    def timer_callback(self, tim):
+        '''!@brief                      Timer callback which latches both encoder counts.
+            @details                    Reads both encoder counters and the time into the next slot of the
+                                        ring buffers and records the time since the last interrupt.
+            @param tim                  The timer which called this method
+        '''
+        now = ticks_us()
+        count_L = self.enc_tim_L.counter()
+        count_R = self.enc_tim_R.counter()
+        last = self.newest
+        newest = last + 1
+        if newest >= self.size:
+            newest = 0
+        self.counts_L[newest] = count_L
+        self.counts_R[newest] = count_R
+        self.times[newest] = now
+        self.newest = newest
+
+        # Record the interrupt interval after the first sample
+        if self.seq != 0:
+            interval = ticks_diff(now, self.times[last])
+            if interval < self.min_interval:
+                self.min_interval = interval
+            if interval > self.max_interval:
+                self.max_interval = interval
+        self.seq = (self.seq + 1) & 0xFFFF
+
+    def latest(self, sample):
+        '''!@brief                      Copies the newest sample.
+            @details                    If the timer interrupt latches a new sample while it is being copied,
+                                        the copy is made again. The time since the sample was latched is
+                                        added to the statistics, which shows how late the tasks run.
+            @param sample               An array('l') of 4 items which is filled with the left count, right
+                                        count, time, and sequence number of the newest sample
+            @return                     The sequence number of the sample, which changes for each new sample
+        '''
+        while True:
+            seq = self.seq
+            newest = self.newest
+            sample[COUNT_L] = self.counts_L[newest]
+            sample[COUNT_R] = self.counts_R[newest]
+            sample[SAMPLE_TIME] = self.times[newest]
+            if seq == self.seq:
+                break
+        sample[SAMPLE_SEQ] = seq
+        age = ticks_diff(ticks_us(), sample[SAMPLE_TIME])
+        if age > self.max_age:
+            self.max_age = age
+        return seq
+
+    def __repr__(self):
+        '''!@brief                      Puts the timing statistics into a string.
+            @return                     A string with the number of samples, the shortest and longest time
+                                        between interrupts, and the longest age of a sample when it was used
+        '''
+        return (f"Encoder samples: {self.seq}, interval {self.min_interval}-{self.max_interval} us, "
+                f"max age {self.max_age} us")
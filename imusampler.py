@@ -0,0 +1,84 @@
+'''!@file                          imusampler.py
+    @brief                         A class to sample the BNO055 IMU at its fusion output rate.
+    @details                       A class that reads the yaw rate and heading of the BNO055 IMU
+                                   in one 4 byte read and puts the raw values and the time of the
+                                   read into a sequence share, so that other tasks can use the
+                                   latest IMU data without reading the I2C bus. The time spent
+                                   on the bus for each read is recorded so the cost of the IMU
+                                   in each control period is known.
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+from time import ticks_us, ticks_ms, ticks_diff
+
+## Index of the heading, in sixteenths of a degree, in the IMU data share
+HEADING = 0
+## Index of the yaw rate, in sixteenths of a degree per second, in the IMU data share
+YAW_RATE = 1
+## Index of the time of the read, from ticks_ms(), in the IMU data share
+TIME = 2
+
+class IMUSampler:
+    '''!@brief                          A class to sample the IMU and share the data.
+        @details                        The BNO055 sensor fusion updates its output at 100 Hz, so objects of
+                                        this class are meant to be run by a task with a 10 ms period. Each
+                                        sample reads the yaw rate and heading registers, which are next to
+                                        each other, in one transaction and writes the raw yaw rate, heading, and time to a SeqShare of three
+                                        32 bit integers. No memory is allocated when a sample is taken.
+    '''
+
+    def __init__(self, imu, share):
+        '''!@brief                      Creates an object of the IMUSampler class.
+            @param imu                  A BNO055 object which has been set to a fusion mode
+            @param share                A task_share.SeqShare of type 'l' and size 3 for the IMU data
+        '''
+        self.imu = imu
+        self.share = share
+        # Create the bus time statistics in microseconds
+        self.last_us = 0
+        self.max_us = 0
+        self.avg_us = 0
+        self.num_samples = 0
+
+    def sample(self):
+        '''!@brief                      Reads the IMU and puts the data into the share.
+            @details                    Reads the yaw rate and heading in one 4 byte read, then writes them
+                                        to the share with the time of the read. The bus time of the read is
+                                        added to the statistics.
+        '''
+        start = ticks_us()
+        self.imu.read_yaw_burst()
+        bus_us = ticks_diff(ticks_us(), start)
+
+        share = self.share
+        share.begin_write()
+        share.write(HEADING, self.imu.get_int16(2))
+        share.write(YAW_RATE, self.imu.get_int16(0))
+        share.write(TIME, ticks_ms())
+        share.end_write()
+
+        self.last_us = bus_us
+        if bus_us > self.max_us:
+            self.max_us = bus_us
+        # Average the bus time over about the last 16 samples
+        if self.num_samples == 0:
+            self.avg_us = bus_us
+        else:
+            self.avg_us += (bus_us - self.avg_us) >> 4
+        self.num_samples += 1
+
+    def bus_time(self):
+        '''!@brief                      Gets the average bus time of each sample.
+            @return                     The running average of the time in microseconds spent reading the IMU
+                                        for each sample
+        '''
+        return self.avg_us
+
+    def __repr__(self):
+        '''!@brief                      Puts the bus time statistics into a string.
+            @return                     A string with the number of samples and the last, average, and
+                                        maximum bus time
+        '''
+        return (f"IMU samples: {self.num_samples}, bus time last {self.last_us} us, "
+                f"avg {self.bus_time()} us, max {self.max_us} us")
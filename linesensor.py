@@ -9,30 +9,58 @@
     @date                          December 13, 2024
 '''
 
-from time import ticks_us, ticks_diff
+from time import ticks_us, ticks_diff, sleep_us
 from array import array
 import time
 from pyb import Pin
-from centroid import Centroid
+from centroid import LinePosition
+
+# The stm module gives direct access to the GPIO registers on the board. It is
+# not available on a host running a fake pyb, in which case the pins are read
+# through the Pin objects instead.
+try:
+    import stm
+except ImportError:
+    stm = None
+
+try:
+    from micropython import native
+except ImportError:
+    def native(fun):
+        return fun
 
 class LineSensor:
     '''!@brief                    A LineSensor class to read the line sensor.
         @details                  Objects of this class can be used to read a single line 
                                   sensor
    '''  
-    def __init__(self, sensor_pin):
+    def __init__(self, sensor_pin, cutoff=1800):
         '''!@brief                Initializes an object associated with a line sensor.
             @details
+            @param sensor_pin     The pin the line sensor is connected to
+            @param cutoff         The time in microseconds after which the sensor is already
+                                  saturated black, so timing stops and the reading is reported
+                                  as saturated
         '''
         # Initialize sensor pin
         self.sensor_pin = Pin(sensor_pin, mode=Pin.OUT_PP) 
         self.sensor_pin_name = sensor_pin
+        # Time for black line reflection reading
+        self.max_reading = 1800
+        # Time for white line reflection reading
+        self.min_reading = 720
+        # Time after which a reading is saturated, and whether the last one was
+        self.cutoff = cutoff
+        self.saturated = False
         
     def read_sensor(self):
         '''!@brief                Reads the value of the line sensor.
             @details              This method sets the pin high and measures how long it takes to go 
                                   low, which depends on the color it reflects off of.
-            @return               The time sensed between high and low output of the line sensor pin.
+                                  Timing stops at the cutoff, so a read never takes more than
+                                  the 10 ms charge plus the cutoff time.
+            @return               The time sensed between high and low output of the line sensor pin,
+                                  or the cutoff time if the reading is saturated
         '''
         # Set the pin to output mode and set it high
         self.sensor_pin = Pin(self.sensor_pin_name, mode=Pin.OUT_PP)
@@ -45,13 +73,14 @@ class LineSensor:
         # Set the sensor pin to input mode
         self.sensor_pin = Pin(self.sensor_pin_name, mode=Pin.IN)
 
-        # Wait for the pin to go low or timeout
+        # Wait for the pin to go low or the cutoff to pass
+        self.saturated = False
         while self.sensor_pin.value() == 1:
-            # Check if timeout has passed
-            if ticks_diff(ticks_us(), start) > 500000:
-                # If it times out, break out of the loop
-                print("Timeout reached")
-                return None  # or return a specific error value
+            # If the cutoff has passed, the sensor is saturated black
+            if ticks_diff(ticks_us(), start) > self.cutoff:
+                self.saturated = True
+                self.time_sensed = self.cutoff
+                return self.time_sensed
         
         # Get time after the pin is low
         end = ticks_us()
@@ -67,90 +96,518 @@ class LineSensor:
                                   white (0)
             @return               1 or 0 if it read black(1) or white(0)
         '''
-        # Time for black line reflection reading
-        self.max_reading = 1800
-        # Time for white line reflection reading
-        self.min_reading = 720
-        
         # Determine a normalized reading based on max and min time
-        self.reading = (reading - self.min_reading) / self.max_reading
+        normalized = (reading - self.min_reading) / self.max_reading
 
-        if self.reading <= 0.3:
+        if normalized <= 0.3:
             return 0
         else:
             return 1
 
-if __name__ == "__main__":
+class LineSensorArray:
+    '''!@brief                    A LineSensorArray class to read every line sensor at once.
+        @details                  Objects of this class charge all of the line sensor pins
+                                  together and then time the decay of every channel in one
+                                  polling loop. Each pass of the loop samples the input data
+                                  register of every GPIO port the sensors are wired to once,
+                                  so a read of the whole array takes about as long as the
+                                  slowest channel rather than the sum of all the channels.
+                                  Measurements can also be split into a start_measurement()
+                                  call and later poll() and result() calls, with a timer
+                                  callback timing the decay in between so that the caller
+                                  never waits for the sensors. If the emitter control pins are
+                                  given, each reading can be paired with a reading taken with
+                                  the emitters off, and the difference used to cancel out
+                                  ambient light.
+   '''
+    
+    ## Measurement phase when no measurement is running
+    IDLE = 0
+    ## Measurement phase while the emitters-off ambient frame is being timed
+    AMBIENT = 1
+    ## Measurement phase while the sensors charge between the two frames
+    CHARGING = 2
+    ## Measurement phase while the emitters-on frame is being timed
+    EMITTED = 3
     
-        # Define sensor pins
-        sensor_7_pin = Pin(Pin.cpu.A15, mode=Pin.OUT_PP)
-        sensor_6_pin = Pin(Pin.cpu.C6, mode=Pin.OUT_PP)
-        sensor_5_pin = Pin(Pin.cpu.C8, mode=Pin.OUT_PP)
-        sensor_4_pin = Pin(Pin.cpu.C12, mode=Pin.OUT_PP)
-        sensor_3_pin = Pin(Pin.cpu.B13, mode=Pin.OUT_PP)
-        sensor_2_pin = Pin(Pin.cpu.B14, mode=Pin.OUT_PP)
-        sensor_1_pin = Pin(Pin.cpu.B15, mode=Pin.OUT_PP)
-        sensor_0_pin = Pin(Pin.cpu.B1, mode=Pin.OUT_PP)
+    def __init__(self, sensor_pins, timeout=2500, timer=None, emitter_pins=(), ambient_every=0):
+        '''!@brief                Initializes an object associated with an array of line sensors.
+            @details              Creates a pin object for each sensor and finds the GPIO port and
+                                  bit that each pin uses so that the ports can be switched and
+                                  read directly during a measurement.
+            @param sensor_pins    A list of the sensor pins in the order of the readings
+            @param timeout        The time in microseconds after which a channel that has not
+                                  decayed is saturated. Timing stops there and the channel is
+                                  recorded as the timeout value.
+            @param timer          A timer object whose callback is used to time non-blocking
+                                  measurements, or None if only read_sensors() is used. Its
+                                  frequency sets the resolution of those measurements.
+            @param emitter_pins   A list of the pins which turn the emitters on when high, such
+                                  as the odd and even control pins
+            @param ambient_every  How often to take an emitters-off ambient frame; 1 takes one
+                                  before every reading, N before every Nth reading, and 0 never
+        '''
+        # Initialize the sensor pins and leave their output latches high so
+        # that switching a pin to output mode charges its sensor
+        self.num_sensors = len(sensor_pins)
+        self.pins = [Pin(sensor_pin, mode=Pin.OUT_PP) for sensor_pin in sensor_pins]
+        for pin in self.pins:
+            pin.high()
+        self.timeout = timeout
+        
+        # Create the array that holds the decay time of each channel
+        self.times = array('H', self.num_sensors*[0])
         
-        # Define Control Odd and Even Pins
-        ctrl_odd_pin = Pin(Pin.cpu.B2, mode=Pin.OUT_PP)
-        ctrl_even_pin = Pin(Pin.cpu.C10, mode=Pin.OUT_PP)
+        # Initialize the emitter pins with the emitters on. Create the array
+        # that holds the decay time of each channel with the emitters off,
+        # which is the timeout until an ambient frame has been taken.
+        self.emitters = [Pin(emitter_pin, mode=Pin.OUT_PP) for emitter_pin in emitter_pins]
+        self.set_emitters(True)
+        self.ambient_every = ambient_every if self.emitters else 0
+        self.ambient_count = 0
+        self.ambient = array('H', self.num_sensors*[timeout])
         
+        # Create the arrays that hold the calibrated white (min) and black
+        # (max) decay times of each channel. Until a calibration is loaded or
+        # run, every channel uses the fixed times from LineSensor, so a
+        # normalized reading of 300 matches its 0.3 threshold. The flag is
+        # only set once a calibration has been loaded or a sweep finished.
+        self.cal_min = array('H', self.num_sensors*[720])
+        self.cal_max = array('H', self.num_sensors*[720 + 1800])
+        self.calibrated = False
+        # Normalized reading above which a channel is read as black
+        self.black_level = 300
+        # Bit mask with one bit set for every channel
+        self.all_mask = (1 << self.num_sensors) - 1
         
-        ctrl_odd_pin.high()
-        ctrl_even_pin.high()
+        # Timer used for non-blocking measurements. The callback is bound once
+        # here so that starting a measurement doesn't allocate memory.
+        self.timer = timer
+        self.timer_cb = self.timer_callback
+        # Phase of the measurement in progress, the channels which are still
+        # high in the frame being timed, and the time that frame started
+        self.phase = LineSensorArray.IDLE
+        self.pending = 0
+        self.start = 0
+        # Bit mask of the channels which were saturated in the last emitters-on frame
+        self.saturated = 0
+        
+        # Group the pins by GPIO port. For each port keep the address of its
+        # input data register and of both halves of its mode register, along
+        # with the mode bits which belong to the sensor pins on that port.
+        self.port_idr = []
+        self.port_moder = []
+        self.port_mode_mask = []
+        self.port_mode_out = []
+        self.chan_port = array('B', self.num_sensors*[0])
+        self.chan_mask = array('H', self.num_sensors*[0])
+        if stm is not None:
+            for n, pin in enumerate(self.pins):
+                gpio = pin.gpio()
+                idr = gpio + stm.GPIO_IDR
+                if idr not in self.port_idr:
+                    self.port_idr.append(idr)
+                    self.port_moder.append(gpio + stm.GPIO_MODER)
+                    self.port_moder.append(gpio + stm.GPIO_MODER + 2)
+                    self.port_mode_mask.extend((0, 0))
+                    self.port_mode_out.extend((0, 0))
+                port = self.port_idr.index(idr)
+                self.chan_port[n] = port
+                self.chan_mask[n] = 1 << pin.pin()
+                # Each half of the mode register holds two bits for each of 8 pins
+                half = 2*port + pin.pin()//8
+                shift = 2*(pin.pin() % 8)
+                self.port_mode_mask[half] |= 0b11 << shift
+                self.port_mode_out[half] |= 0b01 << shift
+        self.num_ports = len(self.port_idr)
+        # Buffer for the input data registers sampled on each pass
+        self.port_levels = array('H', max(self.num_ports, 1)*[0])
+    
+    def set_emitters(self, on):
+        '''!@brief                Turns the emitters on or off.
+            @param on             True to turn the emitters on, False to turn them off
+        '''
+        for emitter in self.emitters:
+            emitter.value(on)
+    
+    def compensate(self):
+        '''!@brief                Removes the ambient light from the emitters-on decay times.
+            @details              Ambient light makes every channel decay faster, so the time by
+                                  which the emitters-off frame fell short of the timeout is added
+                                  back to each emitters-on time, limited to the timeout.
+        '''
+        times = self.times
+        ambient = self.ambient
+        timeout = self.timeout
+        for n in range(self.num_sensors):
+            time_sensed = times[n] + timeout - ambient[n]
+            times[n] = time_sensed if time_sensed < timeout else timeout
+    
+    def charge(self):
+        '''!@brief                Charges every line sensor.
+            @details              Switches all the sensor pins to output mode together. Their
+                                  output latches are already high, so this charges every
+                                  sensor capacitor at once.
+        '''
+        if stm is not None:
+            moder = self.port_moder
+            mask = self.port_mode_mask
+            out = self.port_mode_out
+            for half in range(2*self.num_ports):
+                stm.mem16[moder[half]] = (stm.mem16[moder[half]] & ~mask[half]) | out[half]
+        else:
+            for pin in self.pins:
+                pin.init(Pin.OUT_PP)
+                pin.high()
+    
+    def release(self):
+        '''!@brief                Lets every line sensor start to decay.
+            @details              Switches all the sensor pins to input mode with one write to
+                                  each mode register so that every channel starts decaying at
+                                  the same time.
+        '''
+        if stm is not None:
+            moder = self.port_moder
+            mask = self.port_mode_mask
+            for half in range(2*self.num_ports):
+                stm.mem16[moder[half]] = stm.mem16[moder[half]] & ~mask[half]
+        else:
+            for pin in self.pins:
+                pin.init(Pin.IN)
+    
+    @native
+    def sample(self, pending, elapsed):
+        '''!@brief                Samples the sensors once and records the channels which have fallen.
+            @details              Reads the input data register of each port once, then stores the
+                                  elapsed time for every pending channel that has gone low. Any
+                                  channel still pending after the timeout is given the timeout
+                                  value. This method does not allocate memory, so it may be
+                                  called from a timer callback.
+            @param pending        A bit mask with a bit set for each channel which is still high
+            @param elapsed        The time in microseconds since the sensors were released
+            @return               The bit mask of channels which are still high
+        '''
+        times = self.times
+        if stm is not None:
+            levels = self.port_levels
+            port_idr = self.port_idr
+            for port in range(self.num_ports):
+                levels[port] = stm.mem32[port_idr[port]]
+            chan_port = self.chan_port
+            chan_mask = self.chan_mask
+            for n in range(self.num_sensors):
+                bit = 1 << n
+                if pending & bit and not levels[chan_port[n]] & chan_mask[n]:
+                    times[n] = elapsed
+                    pending &= ~bit
+        else:
+            pins = self.pins
+            for n in range(self.num_sensors):
+                bit = 1 << n
+                if pending & bit and not pins[n].value():
+                    times[n] = elapsed
+                    pending &= ~bit
+        
+        # Record any channel which has not decayed as saturated
+        if elapsed > self.timeout:
+            for n in range(self.num_sensors):
+                if pending & (1 << n):
+                    times[n] = self.timeout
+            self.saturated = pending
+            pending = 0
+        return pending
+    
+    def time_frame(self):
+        '''!@brief                Charges the sensors and times one frame until it is done.
+            @details              This method charges all of the sensors for 10 us, releases them,
+                                  and then polls the GPIO ports until every channel has gone low
+                                  or the timeout has passed. The ports are each sampled once per
+                                  pass and each channel's fall time is stored in the times array.
+        '''
+        # Charge the sensors, then release them all and start timing
+        self.charge()
+        sleep_us(10)
+        self.release()
+        start = ticks_us()
+        
+        # Each bit of pending is set while its channel is still high
+        pending = self.all_mask
+        self.saturated = 0
+        while pending:
+            pending = self.sample(pending, ticks_diff(ticks_us(), start))
+    
+    def ambient_due(self):
+        '''!@brief                Checks if the next reading should include an ambient frame.
+            @return               True if an emitters-off frame should be taken first
+        '''
+        if not self.ambient_every:
+            return False
+        self.ambient_count += 1
+        if self.ambient_count >= self.ambient_every:
+            self.ambient_count = 0
+            return True
+        return False
+    
+    def read_sensors(self):
+        '''!@brief                Reads the decay time of every line sensor.
+            @details              This method times a frame of all the sensors at once and waits
+                                  until it is done. If an ambient frame is due, a frame with the
+                                  emitters off is timed first and used to compensate the reading.
+            @return               The array of decay times in microseconds
+        '''
+        if self.ambient_due():
+            self.set_emitters(False)
+            self.time_frame()
+            for n in range(self.num_sensors):
+                self.ambient[n] = self.times[n]
+            self.set_emitters(True)
+        self.time_frame()
+        if self.ambient_every:
+            self.compensate()
+        return self.times
+    
+    def start_measurement(self):
+        '''!@brief                Starts a measurement which is finished by the timer callback.
+            @details              Charges all of the sensors for 10 us, releases them, and turns on
+                                  the timer callback which samples the sensors on every timer tick
+                                  until every channel has fallen or timed out. If an ambient frame
+                                  is due, it is timed first with the emitters off, and the timer
+                                  callback then charges the sensors and times the emitters-on frame
+                                  by itself, so the caller never waits for either frame. This method
+                                  returns right away; use poll() to check when the result is ready.
+        '''
+        if self.timer is None:
+            raise ValueError('A timer is needed to start a measurement')
+        if self.ambient_due():
+            self.set_emitters(False)
+            self.phase = LineSensorArray.AMBIENT
+        else:
+            self.phase = LineSensorArray.EMITTED
+        self.charge()
+        sleep_us(10)
+        self.release()
+        self.start = ticks_us()
+        self.pending = self.all_mask
+        self.saturated = 0
+        self.timer.callback(self.timer_cb)
+    
+    def timer_callback(self, tim):
+        '''!@brief                Timer callback which times the decay of the sensors.
+            @details              Samples the sensors once per timer tick. When the ambient frame
+                                  is done, it saves the ambient times, turns the emitters on, and
+                                  charges the sensors for one tick before timing the emitters-on
+                                  frame. When that frame is done, it compensates the times for
+                                  ambient light and turns itself off.
+            @param tim            The timer which called this method
+        '''
+        if self.phase == LineSensorArray.CHARGING:
+            self.release()
+            self.start = ticks_us()
+            self.pending = self.all_mask
+            self.saturated = 0
+            self.phase = LineSensorArray.EMITTED
+            return
+        
+        self.pending = self.sample(self.pending, ticks_diff(ticks_us(), self.start))
+        if self.pending:
+            return
+        
+        if self.phase == LineSensorArray.AMBIENT:
+            ambient = self.ambient
+            times = self.times
+            for n in range(self.num_sensors):
+                ambient[n] = times[n]
+            self.set_emitters(True)
+            self.charge()
+            self.phase = LineSensorArray.CHARGING
+        else:
+            if self.ambient_every:
+                self.compensate()
+            self.phase = LineSensorArray.IDLE
+            tim.callback(None)
+    
+    def poll(self):
+        '''!@brief                Checks if a measurement started by start_measurement() is done.
+            @return               True if no measurement is in progress, False if one is running
+        '''
+        return self.phase == LineSensorArray.IDLE
+    
+    def max_read_time(self):
+        '''!@brief                Finds the longest time a complete reading can take.
+            @details              Each frame is charged for 10 us and stops at the timeout, and a
+                                  timer-driven frame can end up to one timer tick late. With an
+                                  ambient frame there are two frames and one tick of charging.
+            @return               The worst-case time in microseconds for a reading
+        '''
+        tick = 1_000_000//self.timer.freq() if self.timer is not None else 0
+        frame_time = 10 + self.timeout + tick
+        if self.ambient_every:
+            return 2*frame_time + tick
+        return frame_time
+    
+    def result(self):
+        '''!@brief                Gets the result of the most recent finished measurement.
+            @details              The result is only valid once poll() has returned True.
+            @return               The array of decay times in microseconds
+        '''
+        return self.times
+    
+    def reset_calibration(self):
+        '''!@brief                Clears the calibration before a new calibration sweep.
+            @details              Sets every channel's minimum as high as possible and its maximum
+                                  to zero so the next calls to calibrate() set both.
+        '''
+        for n in range(self.num_sensors):
+            self.cal_min[n] = 0xFFFF
+            self.cal_max[n] = 0
+        self.calibrated = False
+    
+    def calibrate(self):
+        '''!@brief                Adds the most recent decay times to the calibration.
+            @details              Widens each channel's minimum and maximum to include its most
+                                  recent decay time. It should be called after each read while
+                                  the sensors are swept back and forth across the line, so each
+                                  channel sees both white and black, and the sweep ended with
+                                  finish_calibration().
+        '''
+        times = self.times
+        cal_min = self.cal_min
+        cal_max = self.cal_max
+        for n in range(self.num_sensors):
+            if times[n] < cal_min[n]:
+                cal_min[n] = times[n]
+            if times[n] > cal_max[n]:
+                cal_max[n] = times[n]
+    
+    def finish_calibration(self, min_span=200):
+        '''!@brief                Ends a calibration sweep if every channel has seen white and black.
+            @details              A channel which was never swept across the line has a minimum
+                                  and maximum close together, and would read noise as the line,
+                                  so the calibration is only complete if every channel's maximum
+                                  is at least min_span above its minimum.
+            @param min_span       The smallest difference in microseconds between the calibrated
+                                  white and black decay times of each channel
+            @return               True if the calibration is complete, False if the sweep should
+                                  be repeated
+        '''
+        for n in range(self.num_sensors):
+            if self.cal_max[n] < self.cal_min[n] + min_span:
+                return False
+        self.calibrated = True
+        return True
+    
+    def save_calibration(self, filename='line_cal.bin'):
+        '''!@brief                Saves the calibration to flash.
+            @details              Only a complete calibration can be saved, so that an unfinished
+                                  sweep isn't loaded on the next start-up.
+            @param filename       The name of the file to save the calibration to
+        '''
+        if not self.calibrated:
+            raise ValueError("The line sensor calibration isn't complete")
+        with open(filename, 'wb') as cal_file:
+            cal_file.write(self.cal_min)
+            cal_file.write(self.cal_max)
+    
+    def load_calibration(self, filename='line_cal.bin'):
+        '''!@brief                Loads a calibration saved by save_calibration().
+            @details              If the file is missing or doesn't hold a calibration for this
+                                  number of channels, the calibration is left as it was.
+            @param filename       The name of the file to load the calibration from
+            @return               True if the calibration was loaded, False if it was not
+        '''
+        cal_min = array('H', self.num_sensors*[0])
+        cal_max = array('H', self.num_sensors*[0])
+        try:
+            with open(filename, 'rb') as cal_file:
+                if cal_file.readinto(cal_min) != len(cal_min)*2:
+                    return False
+                if cal_file.readinto(cal_max) != len(cal_max)*2:
+                    return False
+        except OSError:
+            return False
+        
+        for n in range(self.num_sensors):
+            self.cal_min[n] = cal_min[n]
+            self.cal_max[n] = cal_max[n]
+        self.calibrated = True
+        return True
+    
+    @native
+    def normalize(self, values):
+        '''!@brief                Normalizes the most recent decay times.
+            @details              Scales each channel's decay time between its calibrated minimum
+                                  and maximum to an integer from 0 (white) to 1000 (black), using
+                                  integer math only.
+            @param values         An array to be filled with one 0-1000 value for each channel
+            @return               The values array
+        '''
+        times = self.times
+        cal_min = self.cal_min
+        cal_max = self.cal_max
+        for n in range(self.num_sensors):
+            low = cal_min[n]
+            span = cal_max[n] - low
+            value = times[n] - low
+            if value <= 0 or span <= 0:
+                values[n] = 0
+            elif value >= span:
+                values[n] = 1000
+            else:
+                values[n] = value*1000//span
+        return values
+    
+    def black_white(self, values, readings):
+        '''!@brief                Converts normalized values to black(1) or white(0).
+            @param values         An array of 0-1000 values from normalize()
+            @param readings       An array to be filled with one 0 or 1 for each channel
+            @return               The readings array
+        '''
+        black_level = self.black_level
+        for n in range(self.num_sensors):
+            readings[n] = 1 if values[n] > black_level else 0
+        return readings
+    
+    def black_mask(self, values):
+        '''!@brief                Packs normalized values into a mask of black sensors.
+            @details              Bit n of the mask is set if channel n is black. The mask can be
+                                  used to index the arrays of a CentroidTable.
+            @param values         An array of 0-1000 values from normalize()
+            @return               The mask of black sensors
+        '''
+        black_level = self.black_level
+        mask = 0
+        for n in range(self.num_sensors):
+            if values[n] > black_level:
+                mask |= 1 << n
+        return mask
 
-        # Define Sensor Objects
-        sensor_0 = LineSensor(sensor_0_pin)
-        sensor_1 = LineSensor(sensor_1_pin)
-        sensor_2 = LineSensor(sensor_2_pin)
-        sensor_3 = LineSensor(sensor_3_pin)
-        sensor_4 = LineSensor(sensor_4_pin)
-        sensor_5 = LineSensor(sensor_5_pin)
-        sensor_6 = LineSensor(sensor_6_pin)
-        sensor_7 = LineSensor(sensor_7_pin)
-        
-        readings = array('H', 8*[10])
-        
-        while True:
-            # Read all the line sensors
-            sensor_0_reading = sensor_0.read_sensor()
-            sensor_1_reading = sensor_1.read_sensor()
-            sensor_2_reading = sensor_2.read_sensor()
-            sensor_3_reading = sensor_3.read_sensor()
-            sensor_4_reading = sensor_4.read_sensor()
-            sensor_5_reading = sensor_5.read_sensor()
-            sensor_6_reading = sensor_6.read_sensor()
-            sensor_7_reading = sensor_7.read_sensor()
-            
-            # Normalize line sensor values
-            sensor_0_nreading = sensor_0.normalize_reading(sensor_0_reading)
-            sensor_1_nreading = sensor_1.normalize_reading(sensor_1_reading)
-            sensor_2_nreading = sensor_2.normalize_reading(sensor_2_reading)
-            sensor_3_nreading = sensor_3.normalize_reading(sensor_3_reading)
-            sensor_4_nreading = sensor_4.normalize_reading(sensor_4_reading)
-            sensor_5_nreading = sensor_5.normalize_reading(sensor_5_reading)
-            sensor_6_nreading = sensor_6.normalize_reading(sensor_6_reading)
-            sensor_7_nreading = sensor_7.normalize_reading(sensor_7_reading)
-            
-            # Add all line sensor values into a readings array
-            readings[0] = sensor_0_nreading
-            readings[1] = sensor_1_nreading
-            readings[2] = sensor_2_nreading
-            readings[3] = sensor_3_nreading
-            readings[4] = sensor_4_nreading
-            readings[5] = sensor_5_nreading
-            readings[6] = sensor_6_nreading
-            readings[7] = sensor_7_nreading
-            
-            # Determine the weighted sum of the readings
-            sensor_reading = Centroid(readings)
-            #print(sensor_reading.weighted_sum())
-            
-            #print(f"{sensor_0_nreading}, {sensor_1_nreading}, {sensor_2_nreading}, {sensor_3_nreading}, \
-                  #{sensor_4_nreading}, {sensor_5_nreading}, {sensor_6_nreading}, {sensor_7_nreading}")
-            print(f"{sensor_0_reading}, {sensor_1_reading}, {sensor_2_reading}, {sensor_3_reading}, \
-                  {sensor_4_reading}, {sensor_5_reading}, {sensor_6_reading}, {sensor_7_reading}")
-                  
+if __name__ == "__main__":
+    
+    # Define the line sensor array with the pins in reading order and the odd and
+    # even control pins, taking an ambient frame with the emitters off before
+    # each reading
+    line_array = LineSensorArray([Pin.cpu.B1, Pin.cpu.B15, Pin.cpu.B14, Pin.cpu.B13,
+                                  Pin.cpu.C12, Pin.cpu.C8, Pin.cpu.C6, Pin.cpu.A15],
+                                 emitter_pins = (Pin.cpu.B2, Pin.cpu.C10),
+                                 ambient_every = 1)
+    
+    # Use the saved calibration if there is one, or the fixed LineSensor times
+    if not line_array.load_calibration():
+        print("No line sensor calibration saved, using the default times")
+    
+    values = array('H', 8*[0])
+    line_position = LinePosition()
+    
+    while True:
+        # Read all the line sensors at once and normalize the readings
+        times = line_array.read_sensors()
+        line_array.normalize(values)
+        
+        # Find the line position and the mask of black sensors
+        position = line_position.update(values, line_array.saturated)
+        mask = line_array.black_mask(values)
+        
+        print(f"{list(times)}, {list(values)}, mask {mask:08b}, position {position}"
+              f"{' (lost)' if line_position.lost() else ''}")
+        
         time.sleep(0.1)
-        
\ No newline at end of file
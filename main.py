@@ -16,17 +16,21 @@ import cotask
 import task_share
 from pyb import Pin, Timer, I2C, UART, repl_uart
 from encoder_romi import Encoder_romi
-from time import ticks_ms, ticks_diff, sleep
+from velestimator import VelEstimator
+from encsampler import EncSampler, COUNT_L, COUNT_R, SAMPLE_TIME
+from time import ticks_ms, ticks_us, ticks_diff, ticks_add
 from mot_romi import MotorDriver
 import gc
 from array import array
-from closedloopright import ClosedLoopRight
-from closedloopleft import ClosedLoopLeft
-from linvelloop import LinVelLoop
-from yawrateloop import YawRateLoop
+from pid import PID
+from motorid import MotorID, Feedforward
+from autotune import RelayTuner, save_gains, load_gains
 from BNO055 import BNO055
-from linesensor import LineSensor
-from centroid import Centroid
+from linesensor import LineSensorArray
+from centroid import CentroidTable, LinePosition, LINE_BAR
+from imusampler import IMUSampler, HEADING, YAW_RATE
+from yawfusion import YawFusion
+from odometry import Odometry, Move, X, Y, THETA, DIST
 
 def wheel_L(shares):
     '''!@brief                     A task to run and control the left wheel of Romi
@@ -34,6 +38,9 @@ def wheel_L(shares):
                                    encoder, and runs the left motor at a specified duty cycle. 
                                    The duty cycle is determined using a PI controller to control
                                    the left motor.
+                                   When the encoder sampler is used, the encoder counts latched by
+                                   its timer interrupt and the true time between them are used
+                                   instead of reading the encoder when the task runs.
         @param shares              A tuple of multiple shares to share data from and with the task
     '''
     # set state to 0
@@ -48,12 +55,23 @@ def wheel_L(shares):
             mot_L.enable()
             mot_L.set_duty(0)
 
-            # Zero encoder for left wheel
+            # Zero encoder for left wheel and create its velocity estimator
             enc_L.zero()
-            # Set start time as current time
-            old_time = ticks_ms()
-            # Create controller object for left wheel motor
-            cont_L = ClosedLoopLeft()
+            est_L = VelEstimator()
+            velL = 0
+            # Create an array for the encoder samples latched by the timer interrupt,
+            # and set the time of the last sample
+            latched = array('l', 4*[0])
+            old_us = ticks_us()
+            # Create the PI controller object for left wheel motor, with the duty
+            # cycle limited to -100% to 100%
+            cont_L = PID(2.5, 0.5, out_min = -100, out_max = 100)
+            # Load the model of the left motor fitted by motorfit.py for the
+            # feedforward duty cycle, which is zero if no model has been saved
+            ff_L = Feedforward()
+            ff_L.load('L')
+            # Use the gains found by the auto-tuner if they have been saved
+            load_gains(cont_L, 'L')
             # Define variables from shares
             my_velocityL_ref, my_velocityL_meas, my_calib_flag, my_bump_flag, my_end_flag = shares
             L = 0
@@ -65,21 +83,34 @@ def wheel_L(shares):
     
         # State 1 - Update Encoder and Motor Control
         elif state == 1:
-            # Update current time
-            now = ticks_ms() 
-            # Update the encoder and velocity measured
-            enc_L.update()
-            velL = enc_L.get_delta()/(ticks_diff(now,old_time))
-            # Correct the measurement to rad/s  units
-            velL = velL*2*3.1415*1000/1440
-            # Set old time to current time
-            old_time = now
+            if enc_sampler is None:
+                # Update the encoder when the task runs
+                now_us = ticks_us()
+                enc_L.update()
+            else:
+                # Update the encoder with the newest count latched by the timer interrupt
+                enc_sampler.latest(latched)
+                now_us = latched[SAMPLE_TIME]
+                enc_L.update_count(latched[COUNT_L])
+            # Find the true time since the last sample. If there is no new sample,
+            # keep the last velocity and don't add to the integral.
+            dt = ticks_diff(now_us, old_us)
+            if dt > 0:
+                old_us = now_us
+                # Estimate the velocity in counts/s, over a longer window at low speed
+                # when only a few counts pass each period, and correct it to rad/s units
+                velL = est_L.update(enc_L.get_position(), now_us)*(2*3.1415/1440)
+                dt = dt/1_000_000
+            else:
+                dt = 0
             
             # Get desired velocity from shares
             omega_L = my_velocityL_ref.get()
             
-            # Set Duty Cycle based on desired velocity and measured velocity
-            L = cont_L.duty(omega_L, velL)
+            # Shape the desired velocity with the motor model, then set the duty
+            # cycle from the shaped and measured velocities and the feedforward
+            ff = ff_L.duty(omega_L, dt)
+            L = cont_L.update(ff_L.ref, velL, dt, ff)
             mot_L.set_duty(L)
             
             # Put measured velocity into the shares variable
@@ -93,6 +124,17 @@ def wheel_L(shares):
             yield state
         elif state==2:
             #print('Left state 2')
+            # Keep updating the encoder so the odometry follows the maneuvers
+            if enc_sampler is None:
+                now_us = ticks_us()
+                enc_L.update()
+            else:
+                enc_sampler.latest(latched)
+                now_us = latched[SAMPLE_TIME]
+                enc_L.update_count(latched[COUNT_L])
+            if ticks_diff(now_us, old_us) > 0:
+                est_L.update(enc_L.get_position(), now_us)
+                old_us = now_us
             if (my_bump_flag.get() ==0 and my_end_flag.get() == 0):
                 state=1
             yield state
@@ -106,6 +148,9 @@ def wheel_R(shares):
                                    encoder, and runs the right motor at a specified duty cycle. 
                                    The duty cycle is determined using a PI controller to control
                                    the right motor.
+                                   When the encoder sampler is used, the encoder counts latched by
+                                   its timer interrupt and the true time between them are used
+                                   instead of reading the encoder when the task runs.
         @param shares              A tuple of multiple shares to share data from and with the task
     '''
     # Set state to 0
@@ -120,13 +165,23 @@ def wheel_R(shares):
             mot_R.enable()
             mot_R.set_duty(0)
 
-            # Zero Encoder R
+            # Zero Encoder R and create its velocity estimator
             enc_R.zero()
-            
-            # Set old time to now
-            old_time = ticks_ms()
-            # Create controller object for right wheel motor
-            cont_R = ClosedLoopRight()
+            est_R = VelEstimator()
+            velR = 0
+            # Create an array for the encoder samples latched by the timer interrupt,
+            # and set the time of the last sample
+            latched = array('l', 4*[0])
+            old_us = ticks_us()
+            # Create the PI controller object for right wheel motor, with the duty
+            # cycle limited to -100% to 100%
+            cont_R = PID(2.2, 0.5, out_min = -100, out_max = 100)
+            # Load the model of the right motor fitted by motorfit.py for the
+            # feedforward duty cycle, which is zero if no model has been saved
+            ff_R = Feedforward()
+            ff_R.load('R')
+            # Use the gains found by the auto-tuner if they have been saved
+            load_gains(cont_R, 'R')
             # Define variables from shares
             my_velocityR_ref, my_velocityR_meas, my_calib_flag, my_bump_flag, my_end_flag = shares
             
@@ -138,21 +193,34 @@ def wheel_R(shares):
     
         # State 1 - Update Encoder and Motor Control
         elif state == 1:
-            # Update Current time
-            now = ticks_ms()
-            # Update the encoder and velocity measured
-            enc_R.update()
-            velR = enc_R.get_delta()/(ticks_diff(now,old_time))
-            # Correct the measurement to rad/s units
-            velR = velR*2*3.1415*1000/1440
-            # Set old time to current time
-            old_time = now
+            if enc_sampler is None:
+                # Update the encoder when the task runs
+                now_us = ticks_us()
+                enc_R.update()
+            else:
+                # Update the encoder with the newest count latched by the timer interrupt
+                enc_sampler.latest(latched)
+                now_us = latched[SAMPLE_TIME]
+                enc_R.update_count(latched[COUNT_R])
+            # Find the true time since the last sample. If there is no new sample,
+            # keep the last velocity and don't add to the integral.
+            dt = ticks_diff(now_us, old_us)
+            if dt > 0:
+                old_us = now_us
+                # Estimate the velocity in counts/s, over a longer window at low speed
+                # when only a few counts pass each period, and correct it to rad/s units
+                velR = est_R.update(enc_R.get_position(), now_us)*(2*3.1415/1440)
+                dt = dt/1_000_000
+            else:
+                dt = 0
             
             # Get reference velocity from shares
             omega_R = my_velocityR_ref.get()
 
-            # Set Duty Cycle based on desired velocity and measured velocity
-            L = cont_R.duty(omega_R, velR)
+            # Shape the desired velocity with the motor model, then set the duty
+            # cycle from the shaped and measured velocities and the feedforward
+            ff = ff_R.duty(omega_R, dt)
+            L = cont_R.update(ff_R.ref, velR, dt, ff)
             mot_R.set_duty(L)
             
             # Put measured velocity into shares variable
@@ -166,26 +234,368 @@ def wheel_R(shares):
             yield state
         elif state == 2:
             #print('Right state 2')
+            # Keep updating the encoder so the odometry follows the maneuvers
+            if enc_sampler is None:
+                now_us = ticks_us()
+                enc_R.update()
+            else:
+                enc_sampler.latest(latched)
+                now_us = latched[SAMPLE_TIME]
+                enc_R.update_count(latched[COUNT_R])
+            if ticks_diff(now_us, old_us) > 0:
+                est_R.update(enc_R.get_position(), now_us)
+                old_us = now_us
             if (my_bump_flag.get() ==0 and my_end_flag.get() == 0):
                 state=1
             yield state
         else: 
             raise ValueError('Invalid state')
             
+def LineSense(shares):
+    '''!@brief                     A task to read the line sensor and find the line position
+        @details                   A task with four states that initializes the line sensor array,
+                                   waits for the IMU to be calibrated, and then loads the line sensor
+                                   calibration or runs a calibration sweep if none has been saved. 
+                                   Once calibrated, the task collects each finished line sensor 
+                                   measurement, starts the next one, and puts the line position, the
+                                   mask of black sensors, and the time of the measurement into 
+                                   shares for the velocity control task.
+        @param shares              A tuple of multiple shares to share data from and with the task
+    '''
+    # Set state to 0
+    state = 0
+    
+    # Run FSM
+    while True:
+        # State 0 - Line Sensor Setup
+        if state == 0:
+            # Define variables from shares
+            my_line_pos, my_line_mask, my_line_time, my_line_ready, my_calib_flag = shares
+            
+            # Define the line sensor array with the pins in reading order. Timer 6
+            # samples the sensors every 50 us while a measurement is running. The
+            # odd and even control pins switch the emitters so that an ambient
+            # light frame can be taken with the emitters off before each reading.
+            line_tim = Timer(6, freq = 20_000)
+            line_array = LineSensorArray([Pin.cpu.B1, Pin.cpu.B15, Pin.cpu.B14, Pin.cpu.B13,
+                                          Pin.cpu.C12, Pin.cpu.C8, Pin.cpu.C6, Pin.cpu.A15],
+                                         timer = line_tim,
+                                         emitter_pins = (Pin.cpu.B2, Pin.cpu.C10),
+                                         ambient_every = 1)
+            
+            # Create an array for the normalized 0-1000 line sensor values and the
+            # line position estimator
+            line_values = array('H', 8*[0])
+            line_position = LinePosition()
+            
+            state = 1
+            yield state
+        
+        # State 1 - Wait for the IMU to be calibrated
+        elif state == 1:
+            if my_calib_flag.get() == 1:
+                # Load the line sensor calibration, or run a calibration sweep
+                # if there isn't one saved yet
+                if line_array.load_calibration():
+                    my_line_ready.put(1)
+                    state = 3
+                else:
+                    print("Sweep the line sensor across the line")
+                    line_array.reset_calibration()
+                    line_cal_time = ticks_ms()
+                    state = 2
+                # Start the first line sensor measurement
+                line_array.start_measurement()
+            yield state
+        
+        # State 2 - Line Sensor Calibration
+        elif state == 2:
+            # Add each finished measurement to the calibration while the sensor
+            # is swept back and forth across the line
+            if line_array.poll():
+                line_array.calibrate()
+                line_array.start_measurement()
+            # After 5 seconds save the calibration and start reading the line,
+            # or sweep again if any sensor didn't see both white and black
+            if ticks_diff(ticks_ms(), line_cal_time) >= 5000:
+                if line_array.finish_calibration():
+                    line_array.save_calibration()
+                    print("Line Sensor Calibration Complete")
+                    my_line_ready.put(1)
+                    state = 3
+                else:
+                    print("Sweep the line sensor across the line again")
+                    line_array.reset_calibration()
+                    line_cal_time = ticks_ms()
+            yield state
+        
+        # State 3 - Read the Line
+        elif state == 3:
+            # The line is only read with a complete calibration, so go back to
+            # the calibration sweep if there isn't one
+            if not line_array.calibrated:
+                print("Sweep the line sensor across the line")
+                my_line_ready.put(0)
+                line_array.reset_calibration()
+                line_cal_time = ticks_ms()
+                state = 2
+            # Collect the line sensor measurement started on the last run and start
+            # the next one. If it isn't done yet, the shares keep the last sample.
+            elif line_array.poll():
+                line_array.normalize(line_values)
+                # Put the line position, from -3500 at sensor 0 to 3500 at sensor 7,
+                # the mask of black sensors, and the time into the shares
+                my_line_pos.put(line_position.update(line_values, line_array.saturated))
+                my_line_mask.put(line_array.black_mask(line_values))
+                my_line_time.put(ticks_ms())
+                line_array.start_measurement()
+            yield state
+        
+        else: 
+            raise ValueError('Invalid state')
+            
+def PoseEstimate(shares):
+    '''!@brief                     A task to track the pose of Romi
+        @details                   A task with two states that waits for the IMU to be calibrated,
+                                   zeroes the pose, and then updates the pose every run from the
+                                   positions of both encoders and the heading from the IMU sampling
+                                   task. The task runs at the same rate as the wheel tasks and puts
+                                   the pose into a sequence share so the velocity control task can
+                                   run its maneuvers to distance and angle targets.
+        @param shares              A tuple of multiple shares to share data from and with the task
+    '''
+    # Set state to 0
+    state = 0
+    
+    # Run FSM
+    while True:
+        # State 0 - Wait for the IMU to be calibrated
+        if state == 0:
+            # Define variables from shares
+            my_pose, my_imu_data, my_calib_flag = shares
+            
+            # Create the odometry object
+            odometry = Odometry(my_pose)
+            # The IMU heading is used once the IMU sampling task has written a sample
+            imu_sampled = False
+            
+            if my_calib_flag.get() == 1:
+                # Start the pose at zero where the Romi is now
+                odometry.reset(enc_L.get_position(), enc_R.get_position())
+                state = 1
+            yield state
+        
+        # State 1 - Update the Pose
+        elif state == 1:
+            # Only use the IMU heading once it has been sampled. The sequence number
+            # of the share wraps back to 0, so it is only checked until the first
+            # sample is seen.
+            if not imu_sampled and my_imu_data.seq_num() != 0:
+                imu_sampled = True
+            if not imu_sampled:
+                odometry.update(enc_L.get_position(), enc_R.get_position())
+            else:
+                odometry.update(enc_L.get_position(), enc_R.get_position(), my_imu_data.get(HEADING))
+            yield state
+        
+        else: 
+            raise ValueError('Invalid state')
+            
+def MotorIdent(shares):
+    '''!@brief                     A task to log the response of both motors for motorfit.py
+        @details                   A task with three states that runs both motors through the
+                                   identification schedule of the MotorID class while logging the
+                                   velocity of each wheel, saves the logs to id_L.csv and id_R.csv,
+                                   and then does nothing. The Romi should be held with its wheels
+                                   off the ground. This task is only run instead of the other tasks
+                                   when MOTOR_ID is set to True.
+        @param shares              A tuple of multiple shares to share data from and with the task
+    '''
+    # Set state to 0
+    state = 0
+    
+    # Run FSM
+    while True:
+        # State 0 - Motor Setup
+        if state == 0:
+            # Enable both motors and create the identification objects
+            mot_L.enable()
+            mot_R.enable()
+            enc_L.zero()
+            enc_R.zero()
+            ident_L = MotorID(mot_L, enc_L)
+            ident_R = MotorID(mot_R, enc_R)
+            state = 1
+            yield state
+        
+        # State 1 - Run the Schedule
+        elif state == 1:
+            running_L = ident_L.sample()
+            running_R = ident_R.sample()
+            if not running_L and not running_R:
+                # Stop the motors and save both logs
+                mot_L.disable()
+                mot_R.disable()
+                ident_L.save('id_L.csv')
+                ident_R.save('id_R.csv')
+                print('Saved id_L.csv and id_R.csv')
+                state = 2
+            yield state
+        
+        # State 2 - Done
+        elif state == 2:
+            yield state
+        
+        else: 
+            raise ValueError('Invalid state')
+            
+def AutoTune(shares):
+    '''!@brief                     A task to tune the gains of one control loop
+        @details                   A task with four states that runs a relay experiment on the
+                                   loop chosen by TUNE, computes new gains from the ultimate gain
+                                   and period, and saves them to gains.json, where they are loaded
+                                   by the other tasks at the next start-up. For a wheel, 'L' or
+                                   'R', the relay sets the duty cycle of the motor around the
+                                   feedforward duty cycle, with the Romi held off the ground, and
+                                   PI gains are found. For the yaw rate, 'yaw', the relay sets the
+                                   yaw rate reference of the wheel tasks, which must be running,
+                                   so the Romi wiggles in place on the ground, and a proportional
+                                   gain is found from the encoder yaw rate. The wheels should be
+                                   tuned before the yaw rate. The relay does a little work each
+                                   run, so the task never blocks the scheduler.
+        @param shares              A tuple of multiple shares to share data from and with the task
+    '''
+    # Set state to 0
+    state = 0
+    
+    # Run FSM
+    while True:
+        # State 0 - Relay Setup
+        if state == 0:
+            # Define variables from shares
+            my_velL_ref, my_velL_meas, my_velR_ref, my_velR_meas, my_calib_flag = shares
+            
+            # Define trackwidth and wheel radius
+            w = 0.141
+            r_w = 0.035
+            
+            if TUNE == 'yaw':
+                # Switch the yaw rate reference by 1.5 rad/s either side of zero
+                tuner = RelayTuner(0, 1.5, hysteresis = 0.1)
+                # Start the wheel tasks without waiting for the IMU
+                my_calib_flag.put(1)
+            else:
+                if TUNE == 'L':
+                    mot, enc = mot_L, enc_L
+                else:
+                    mot, enc = mot_R, enc_R
+                # Switch the duty cycle by 10% either side of the duty cycle which
+                # holds the wheel at 8 rad/s
+                ff = Feedforward()
+                if ff.load(TUNE):
+                    offset = ff.steady(8)
+                else:
+                    offset = 25
+                tuner = RelayTuner(8, 10, offset, hysteresis = 0.3)
+                mot.enable()
+                enc.zero()
+                est = VelEstimator()
+            state = 1
+            yield state
+        
+        # State 1 - Run the Relay
+        elif state == 1:
+            if TUNE == 'yaw':
+                yaw_rate_meas = (my_velR_meas.get() - my_velL_meas.get())*(r_w/w)
+                yaw_rate_ref = tuner.update(yaw_rate_meas)
+                my_velL_ref.put(-(w/(2*r_w))*yaw_rate_ref)
+                my_velR_ref.put((w/(2*r_w))*yaw_rate_ref)
+            else:
+                enc.update()
+                vel = est.update(enc.get_position(), ticks_us())*(2*3.1415/1440)
+                mot.set_duty(tuner.update(vel))
+            if tuner.done():
+                state = 2
+            yield state
+        
+        # State 2 - Save the Gains
+        elif state == 2:
+            # Stop the wheels
+            if TUNE == 'yaw':
+                my_velL_ref.put(0)
+                my_velR_ref.put(0)
+            else:
+                mot.set_duty(0)
+                mot.disable()
+            
+            if tuner.failed:
+                print('Tuning failed, no oscillation was measured')
+            else:
+                if TUNE == 'yaw':
+                    K_p, K_i = tuner.gains('P')
+                else:
+                    K_p, K_i = tuner.gains('PI')
+                save_gains(TUNE, K_p, K_i, tuner.K_u, tuner.P_u)
+                print(f"{TUNE}: K_u = {tuner.K_u:.3f}, P_u = {tuner.P_u:.3f} s, K_p = {K_p:.3f}, K_i = {K_i:.3f}")
+            state = 3
+            yield state
+        
+        # State 3 - Done
+        elif state == 3:
+            yield state
+        
+        else: 
+            raise ValueError('Invalid state')
+            
+def IMUSample(shares):
+    '''!@brief                     A task to sample the IMU at its fusion output rate
+        @details                   A task with two states that waits for the IMU to be calibrated
+                                   and then reads the yaw rate and heading of the IMU once every 
+                                   run. The task runs every 10 ms to match the 100 Hz output of the
+                                   BNO055 sensor fusion, and puts the data into a sequence share so
+                                   the velocity control task doesn't have to read the I2C bus.
+        @param shares              A tuple of multiple shares to share data from and with the task
+    '''
+    # Set state to 0
+    state = 0
+    
+    # Run FSM
+    while True:
+        # State 0 - Wait for the IMU to be calibrated
+        if state == 0:
+            # Define variables from shares
+            my_imu_data, my_calib_flag = shares
+            
+            if my_calib_flag.get() == 1:
+                state = 1
+            yield state
+        
+        # State 1 - Sample the IMU
+        elif state == 1:
+            imu_sampler.sample()
+            yield state
+        
+        else: 
+            raise ValueError('Invalid state')
+            
 def VelControl(shares):
     '''!@brief                     A task to run and control the linear velocity and yaw rate of Romi
-        @details                   A task with four states that initializes the IMU and calibrates it.
-                                   The task takes in data from the LineSensor and Centroid class that
-                                   creates a weighted sum, which determines the specified yaw rate.
-                                   The task specifies the linear velocity and uses the yaw rate
-                                   from the centroid class before creating objects for linear 
+        @details                   A task with six states that initializes the IMU and calibrates it.
+                                   The IMU calibration is saved to flash once it is done by hand
+                                   and loaded at the next start-up, so the task only has to wait
+                                   for the sensor fusion to start running.
+                                   The task takes in the line position from the line sensing task,
+                                   which determines the specified yaw rate. The task specifies the linear velocity and uses the yaw rate
+                                   from the line position before creating objects for linear 
                                    velocity and yaw rate controllers. The task uses these controllers
                                    and the data from the encoders to control the yaw rate and linear 
                                    velocity of Romi. The task calculates new reference velocities
                                    for the left and right motor and sends these values to the wheel_L
                                    and wheel_R tasks.The task monitors the bump sensors and runs the 
                                    Romi around the box if the bump sensors are triggered. The task also
-                                   returns the Romi to the start of the track.
+                                   returns the Romi to the start of the track. Once the IMU is 
+                                   calibrated, the task waits for the line sensing task to be ready
+                                   before it starts driving.
         @param shares              A tuple of multiple shares to share data from and with the task
     '''
     # Define state 0
@@ -196,7 +606,8 @@ def VelControl(shares):
         # State 0 - Setup
         if state == 0:
             # Define reference variables from shares
-            our_velL_ref, our_velL_meas, our_velR_ref, our_velR_meas, our_calib_flag, our_bump_flag, our_end_flag = shares
+            our_velL_ref, our_velL_meas, our_velR_ref, our_velR_meas, our_calib_flag, our_bump_flag, our_end_flag, \
+                our_line_pos, our_line_mask, our_line_ready, our_imu_data, our_pose = shares
             
             # Define trackwidth
             w = 0.141
@@ -210,42 +621,11 @@ def VelControl(shares):
             # Define bump flag variable
             bump_flag = 0
             
-            all_ones = True
             # Initialize Sharp time
             sharp_time = 0
-            
-            turn_done_flag = 0
 
-            # Define sensor pins
-            sensor_0_pin = Pin(Pin.cpu.A15, mode=Pin.OUT_PP)
-            sensor_1_pin = Pin(Pin.cpu.C6, mode=Pin.OUT_PP)
-            sensor_2_pin = Pin(Pin.cpu.C8, mode=Pin.OUT_PP)
-            sensor_3_pin = Pin(Pin.cpu.C12, mode=Pin.OUT_PP)
-            sensor_4_pin = Pin(Pin.cpu.B13, mode=Pin.OUT_PP)
-            sensor_5_pin = Pin(Pin.cpu.B14, mode=Pin.OUT_PP)
-            sensor_6_pin = Pin(Pin.cpu.B15, mode=Pin.OUT_PP)
-            sensor_7_pin = Pin(Pin.cpu.B1, mode=Pin.OUT_PP)
-            
-            # Define Control Odd and Even Pins
-            ctrl_odd_pin = Pin(Pin.cpu.B2, mode=Pin.OUT_PP)
-            ctrl_even_pin = Pin(Pin.cpu.C10, mode=Pin.OUT_PP)
-            
-            # Set the Pins high
-            ctrl_odd_pin.high()
-            ctrl_even_pin.high()
-
-            # Define Sensor Objects
-            sensor_0 = LineSensor(sensor_0_pin)
-            sensor_1 = LineSensor(sensor_1_pin)
-            sensor_2 = LineSensor(sensor_2_pin)
-            sensor_3 = LineSensor(sensor_3_pin)
-            sensor_4 = LineSensor(sensor_4_pin)
-            sensor_5 = LineSensor(sensor_5_pin)
-            sensor_6 = LineSensor(sensor_6_pin)
-            sensor_7 = LineSensor(sensor_7_pin)
-            
-            # Create a sensor readings array
-            readings = array('H', 8*[10])
+            # Create the table of line data for each mask of black sensors
+            line_table = CentroidTable()
             
             # Initialize Bump Sensor Pins as inputs
             bump_sensor_0 = Pin(Pin.cpu.D2, mode = Pin.IN, pull = Pin.PULL_UP)
@@ -253,38 +633,48 @@ def VelControl(shares):
             bump_sensor_2 = Pin(Pin.cpu.B7, mode = Pin.IN, pull = Pin.PULL_UP)
             
             
-            tleft_time = None
             current_time = None
             
-            # Initialize controller objects for linear velocity and yaw rate
-            lin_cont = LinVelLoop()
-            yaw_cont = YawRateLoop()
-            
-            # Initialize IMU i2c object
-            i2c = I2C(1, I2C.CONTROLLER, baudrate=100000)
-            imu = BNO055(i2c, Pin.cpu.B9, Pin.cpu.B8, Pin.cpu.C9)
-            imu.set_mode(0x0C)  # NDOF mode
+            # Initialize proportional controller objects for linear velocity and yaw rate
+            lin_cont = PID(1.75)
+            yaw_cont = PID(1.75)
+            # Use the yaw rate gain found by the auto-tuner if it has been saved
+            load_gains(yaw_cont, 'yaw')
             
-            # Read Calibration Status of the IMU and display it
-            sys_calib_status, gyr_calib_status, acc_calib_status, mag_calib_status = imu.get_calib_status()
-            print(f"{sys_calib_status}, {gyr_calib_status}, {acc_calib_status}, {mag_calib_status}")
+            # Create an array for the heading, yaw rate, and time from the IMU sampling task
+            imu_values = array('l', 3*[0])
+            # Create the filter which fuses the encoder and gyro yaw rates, and
+            # start with no desired linear velocity
+            yaw_fusion = YawFusion()
+            lin_vel_ref = 0
             
-            # If IMU is fully calibrated, set calib_flag to 1 to signal that it is calibrated 
-            if sys_calib_status == 3 and gyr_calib_status == 3 and acc_calib_status == 3 and mag_calib_status == 3:
-                calib_flag = 1
-                print("Calibration Complete")
-                our_calib_flag.put(calib_flag)
-                
-            our_calib_flag.put(calib_flag)   
+            # Create the object which runs moves to distance and angle targets and an
+            # array for the pose
+            move = Move(our_pose)
+            pose_values = array('f', 4*[0])
+            # Define the moves around the box after a bump. Each move has the pose value
+            # to move (distance or angle), the target in m or rad, the timeout in ms,
+            # and the left and right duty cycles. A duty cycle of None disables that
+            # motor so the Romi pivots around its wheel. The timeouts are the times of
+            # the original timed maneuver.
+            bump_moves = ((DIST, -0.12, 800, -30, -30),     # Back up
+                          (THETA, -0.58, 550, 30, None),    # Turn right
+                          (DIST, 0.10, 650, 30, 30),        # Forward
+                          (THETA, 0.49, 460, None, 30),     # Turn left
+                          (DIST, 0.30, 2040, 27, 30))       # Forward past the box
+            bump_step = 0
+            return_step = 0
             
-            # Set state to 1
-            if calib_flag == 1:
-                sleep(10)
-                init_heading = imu.read_heading()
-                print(f"{init_heading}")
-                done_time = ticks_ms()
-                state = 1
+            # Load the IMU calibration saved on an earlier start-up. If there is one,
+            # the IMU can be used as soon as the sensor fusion is running.
+            imu_calibrated = imu.load_calibration()
+            if imu_calibrated:
+                print("IMU Calibration Loaded")
+            imu_ready_time = ticks_ms()
+            our_calib_flag.put(calib_flag)
             
+            # Wait for the IMU to be calibrated and ready
+            state = 5
             yield state
             
             # State 1 - Velocity Control
@@ -296,67 +686,39 @@ def VelControl(shares):
                     
             if (bump_sensor_0.value() == 0 or bump_sensor_1.value() == 0 or bump_sensor_2.value() == 0):
                 print('bumped')
-                back_time = ticks_ms()
-                tright_time = None
-                tleft_time = None
+                # Start the first move around the box
+                bump_step = 0
+                move.start(bump_moves[0][0], bump_moves[0][1], bump_moves[0][2])
                 our_bump_flag.put(1)
                 bump_flag = 1
                 state = 2
             
-            # Read all the line sensors
-            sensor_7_reading = sensor_0.read_sensor()
-            sensor_6_reading = sensor_1.read_sensor()
-            sensor_5_reading = sensor_2.read_sensor()
-            sensor_4_reading = sensor_3.read_sensor()
-            sensor_3_reading = sensor_4.read_sensor()
-            sensor_2_reading = sensor_5.read_sensor()
-            sensor_1_reading = sensor_6.read_sensor()
-            sensor_0_reading = sensor_7.read_sensor()
-            
-            # Normalize line sensor values
-            sensor_0_nreading = sensor_0.normalize_reading(sensor_0_reading)
-            sensor_1_nreading = sensor_1.normalize_reading(sensor_1_reading)
-            sensor_2_nreading = sensor_2.normalize_reading(sensor_2_reading)
-            sensor_3_nreading = sensor_3.normalize_reading(sensor_3_reading)
-            sensor_4_nreading = sensor_4.normalize_reading(sensor_4_reading)
-            sensor_5_nreading = sensor_5.normalize_reading(sensor_5_reading)
-            sensor_6_nreading = sensor_6.normalize_reading(sensor_6_reading)
-            sensor_7_nreading = sensor_7.normalize_reading(sensor_7_reading)
-            
-            # Add all line sensor values into a readings array
-            readings[0] = sensor_0_nreading
-            readings[1] = sensor_1_nreading
-            readings[2] = sensor_2_nreading
-            readings[3] = sensor_3_nreading
-            readings[4] = sensor_4_nreading
-            readings[5] = sensor_5_nreading
-            readings[6] = sensor_6_nreading
-            readings[7] = sensor_7_nreading
-            
-            #print(f"{readings}")
-            
-            # Determine the weighted sum of the readings
-            sensor_reading = Centroid(readings)
-            reading = sensor_reading.weighted_sum()
-            #print(reading)
-            
-            if -1 <= reading <= 1:
+            # Get the most recent line position and mask of black sensors from
+            # the line sensing task
+            position = our_line_pos.get()
+            line_mask = our_line_mask.get()
+            
+            #print(position)
+            
+            # Drive straight over a bar, such as the finish or a cross line, since
+            # its position isn't the position of the line being followed
+            if line_table.flags[line_mask] & LINE_BAR:
+                yaw_rate = 0
+            # Drive straight while the line is within half a sensor of the
+            # center, otherwise set the yaw rate in proportion to the position
+            # up to 5 rad/s at the outer sensors
+            elif -500 <= position <= 500:
                 yaw_rate = 0
-            elif -11 <= reading < -1:
-                yaw_rate = -3
-            elif reading < -11:
-                yaw_rate = -5
-                sharp_time = ticks_ms()
-            elif 1 < reading <= 11:
-                yaw_rate = 3
-            else:  
-                yaw_rate = 5
-                sharp_time = ticks_ms()
+            else:
+                yaw_rate = position*(5/3500)
+                # Slow down once the line is under the outer two sensors
+                if position <= -3000 or position >= 3000:
+                    sharp_time = ticks_ms()
                 
             # Get current time
             current_time = ticks_ms()
             
-            # If it has been less than 1.5 seconds since a +/- 12 reading
+            # If it has been less than 2 seconds since the line was at an outer sensor
             if ticks_diff(current_time, sharp_time) < 2000:
                 # Set linear velocity to slower rate
                 lin_vel = 0.065
@@ -365,53 +727,53 @@ def VelControl(shares):
                 lin_vel = 0.2
         
         
-            # Reading sum variable initialized
-            reading_sum = 0
-            all_ones = False
+            # Look up the number of black sensors
+            reading_sum = line_table.counts[line_mask]
             
             print(ticks_diff(current_time, done_time))
             if bump_flag == 1 and ticks_diff(current_time,done_time) >= 12000:
-                for value in readings: 
-                    reading_sum += value
-                    if reading_sum >= 4:
-                        all_ones = True
-                if all_ones == True:
-                    all_ones_time= ticks_ms()
+                # The finish bar has 4 or more black sensors
+                if line_table.flags[line_mask] & LINE_BAR:
+                    # Start going forward out of the finish box
+                    return_step = 0
+                    move.start(DIST, 0.06, 600)
                     our_end_flag.put(1)
                     state = 3
             elif ticks_diff(current_time,done_time) <= 12000:
-                  for value in readings:
-                      reading_sum += value
-                      if reading_sum >= 3:
-                          all_ones = True
-                  if all_ones == True:
+                  if reading_sum >= 3:
                       yaw_rate = 0  
                       lin_vel = 0.2
             else:
-                for value in readings:
-                    reading_sum += value
-                    if reading_sum >= 5:
-                        all_ones = True
-                if all_ones == True:
+                if reading_sum >= 5:
                     yaw_rate = 0  
                     lin_vel = 0.25
                     
+            # Find the true time in seconds since the last run, which is longer
+            # than the period when a run is skipped
+            now_us = ticks_us()
+            dt = ticks_diff(now_us, old_us)/1_000_000
+            old_us = now_us
+            
+            # Get the latest angular velocity and heading from the IMU sampling task
+            our_imu_data.read(imu_values)
+            curr_heading = imu_values[HEADING]/16
+           
+            # Calculate measured yaw rate by fusing the encoder yaw rate with the
+            # gyro yaw rate
+            yaw_rate_meas = yaw_fusion.update((omega_R_act-omega_L_act)*(r_w/w), imu_values[YAW_RATE])
+            
             # Calculate measured linear velocity
             lin_vel_meas = (omega_L_act + omega_R_act)*(r_w/2)
             
-            # Get desired linear velocity from controller
-            lin_vel_ref = lin_cont.set_vel(lin_vel, lin_vel_meas)
+            # Get desired linear velocity from controller. While a wheel slips the
+            # encoders don't measure how fast the Romi moves, so the last desired
+            # linear velocity is kept until the wheels grip again.
+            if not yaw_fusion.slipping():
+                lin_vel_ref = lin_cont.update(lin_vel, lin_vel_meas, dt)
            # print(f"{lin_vel}, {lin_vel_ref}, {lin_vel_meas}")
             
-            # Read IMU to get angular velocity
-            IMU_yaw_rate = imu.read_yaw_rate()
-            # Convert from degrees to rad
-            yaw_rate_meas = IMU_yaw_rate * 3.1415/180
-           
-            # Calculate measured yaw rate
-            yaw_rate_meas = (omega_R_act-omega_L_act)*(r_w/w)
             # Get desired yaw rate from controller
-            yaw_rate_ref = yaw_cont.set_yaw(yaw_rate, yaw_rate_meas)
+            yaw_rate_ref = yaw_cont.update(yaw_rate, yaw_rate_meas, dt)
             #print (yaw_rate_ref)
             
             # Calculate desired left and right motor velocities
@@ -422,96 +784,87 @@ def VelControl(shares):
             our_velL_ref.put(omega_L_ref)
             our_velR_ref.put(omega_R_ref)
             
-            curr_heading = imu.read_heading()
             print(f"{curr_heading}, {init_heading}")
             
             yield state
             
         # State 2 - Bumped
         elif state == 2:
-            now_time = ticks_ms()
-            # First: Handle "back" movement
-            if ticks_diff(now_time, back_time) <= 800:
-                print('back')
-                #print(f"{lin_vel}, {lin_vel_ref}, {lin_vel_meas}")
-                mot_L.set_duty(-30)
-                mot_R.set_duty(-30)                
-                tright_time = None
-                tleft_time = None
-            else:
-                if tright_time is None: # Set tright_time only once
-                    tright_time = ticks_ms()  # Record the start time of "right" state
-                elif ticks_diff(now_time, tright_time) <= 550:
-                    # Continue "right" movement
-                    print('Turn R')
+            if bump_step < len(bump_moves):
+                # Run the current move around the box
+                index, target, timeout, duty_L, duty_R = bump_moves[bump_step]
+                if duty_L is None:
+                    mot_L.disable()
+                else:
                     mot_L.enable()
+                    mot_L.set_duty(duty_L)
+                if duty_R is None:
                     mot_R.disable()
-                    mot_L.set_duty(30)
-                elif ticks_diff(now_time, tright_time) <= 1200:
-                    # Forward movement
-                    print('frwd')
-                    mot_R.enable()
-                    mot_L.set_duty(30)
-                    mot_R.set_duty(30)
                 else:
-                    if tleft_time is None: # Set tright_time only once
-                        tleft_time = ticks_ms()  # Record the start time of "right" state
-                    elif ticks_diff(now_time, tleft_time) <= 460:
-                        # Continue "right" movement
-                        print('Turn L')
-                        mot_R.enable()
-                        mot_L.disable()
-                        mot_R.set_duty(30)
-                    elif ticks_diff(now_time, tleft_time) <= 2500:
-                        # Forward movement
-                        print('frwd')
-                        mot_L.enable()
-                        mot_L.set_duty(27)
-                        mot_R.set_duty(30)
-                    else:
-                        # Return to state 1
-                        print('transition to state 1')
-                        # Ensure tright_time and tleft_time are reset here
-                        done_time = ticks_ms()
-                        tright_time = None
-                        tleft_time = None
-                        state = 1
-                        # Reset bump flag share variable
-                        our_bump_flag.put(0)
+                    mot_R.enable()
+                    mot_R.set_duty(duty_R)
+                
+                # Start the next move once this one reaches its target
+                if move.done():
+                    print(f"move {bump_step} done, timed out: {move.timed_out}")
+                    bump_step += 1
+                    if bump_step < len(bump_moves):
+                        index, target, timeout, duty_L, duty_R = bump_moves[bump_step]
+                        move.start(index, target, timeout)
+            else:
+                # Return to state 1
+                print('transition to state 1')
+                mot_L.enable()
+                mot_R.enable()
+                done_time = ticks_ms()
+                # Time the control loop from when it starts again
+                old_us = ticks_us()
+                state = 1
+                # Reset bump flag share variable
+                our_bump_flag.put(0)
             
             yield state
             
         # State 3 - Return to Start    
         elif state == 3:
-            # Get the current heading from the imu
-            curr_heading = imu.read_heading()
+            # Get the current heading from the IMU sampling task
+            our_imu_data.read(imu_values)
+            curr_heading = imu_values[HEADING]/16
             #print(f"{curr_heading}, {init_heading}")
-            # Record the time when all black is read
-            all_ones_now = ticks_ms()
-            # Go forward for 600 ms
-            if ticks_diff(all_ones_now, all_ones_time) <= 600:
+            # Go forward out of the finish box
+            if return_step == 0:
                 print('forward')
                 mot_L.set_duty(20)
                 mot_R.set_duty(20)
+                if move.done():
+                    return_step = 1
             # Turn around until the heading is accurate
-            elif abs(curr_heading - init_heading) >= .5 and turn_done_flag == 0:
-                print('turn')
-                mot_L.set_duty(-10)
-                mot_R.set_duty(10)
-                turn_time = ticks_ms()
-            # Pause for  500 ms
-                print(f"{curr_heading}, {init_heading}")
-            elif ticks_diff(all_ones_now, turn_time) <= 500:
+            elif return_step == 1:
+                if abs(curr_heading - init_heading) >= .5:
+                    print('turn')
+                    mot_L.set_duty(-10)
+                    mot_R.set_duty(10)
+                    print(f"{curr_heading}, {init_heading}")
+                else:
+                    turn_time = ticks_ms()
+                    return_step = 2
+            # Pause for 500 ms
+            elif return_step == 2:
                 print('stopped')
-                turn_done_flag = 1
                 mot_L.set_duty(0)
                 mot_R.set_duty(0)
-            # Go Forward for the next 3600 ms
-            elif ticks_diff(all_ones_now, turn_time) <= 2050:
-                #IF NOT WORK PUT BACK TO <= 4100, L=34.5, R=30
+                if ticks_diff(ticks_ms(), turn_time) >= 500:
+                    # Drive the distance back to where the Romi started
+                    our_pose.read(pose_values)
+                    move.start(DIST, (pose_values[X]**2 + pose_values[Y]**2)**0.5, 1550)
+                    return_step = 3
+            # Go forward to the start
+            elif return_step == 3:
                 #print('forward to start')
                 mot_L.set_duty(64.5)
                 mot_R.set_duty(60)
+                if move.done():
+                    return_step = 4
             # Disable the motors as the Track has been completed
             else:
                 #print('done')
@@ -519,6 +872,42 @@ def VelControl(shares):
                 mot_R.disable()
             yield state
             
+        # State 5 - IMU Calibration
+        elif state == 5:
+            if not imu_calibrated:
+                # Read Calibration Status of the IMU and display it
+                sys_calib_status, gyr_calib_status, acc_calib_status, mag_calib_status = imu.get_calib_status()
+                print(f"{sys_calib_status}, {gyr_calib_status}, {acc_calib_status}, {mag_calib_status}")
+                
+                # Once the IMU is fully calibrated by hand, save the calibration and
+                # give 10 seconds to put the Romi down at the start
+                if sys_calib_status == 3 and gyr_calib_status == 3 and acc_calib_status == 3 and mag_calib_status == 3:
+                    print("Calibration Complete")
+                    imu.save_calibration()
+                    imu_calibrated = True
+                    imu_ready_time = ticks_add(ticks_ms(), 10_000)
+            
+            # When the IMU is calibrated and the sensor fusion is running, set calib_flag
+            # to 1 to signal that it is calibrated and get the starting heading
+            elif ticks_diff(ticks_ms(), imu_ready_time) >= 0 and imu.get_sys_status() == 5:
+                calib_flag = 1
+                our_calib_flag.put(calib_flag)
+                init_heading = imu.read_heading()
+                print(f"{init_heading}")
+                # Wait for the line sensing task to be ready
+                state = 4
+            yield state
+        
+        # State 4 - Wait for the Line Sensor
+        elif state == 4:
+            # Start driving once the line sensing task is calibrated and reading
+            if our_line_ready.get() == 1:
+                done_time = ticks_ms()
+                # Time the control loop from when it starts
+                old_us = ticks_us()
+                state = 1
+            yield state
+            
         else:
             raise ValueError('Invalid State')
 
@@ -548,6 +937,13 @@ if __name__ == "__main__":
     # Zero encoder L
     enc_L.zero()
     
+    # Create the sampler which latches both encoder counts every 6 ms from the
+    # Timer 7 interrupt. Timer 7 counts at 80 MHz, so a prescaler of 80 and a
+    # period of 6000 counts gives exactly 6 ms. Set enc_sampler to None to read
+    # the encoders whenever the wheel tasks run instead.
+    enc_sampler = EncSampler(Timer(7, prescaler = 79, period = 5999), tim_ENL, tim_ENR)
+    enc_sampler.start()
+    
     
     # Create reference and measured velocity share variables for the left motor
     velocityL_ref = task_share.Share('f', thread_protect = False, name = "velocityL_ref")
@@ -562,31 +958,124 @@ if __name__ == "__main__":
     Bump_flag = task_share.Share('H', thread_protect = False, name = "Bump flag")
     end_flag = task_share.Share('H', thread_protect = False, name = "end_flag")
     
-    # Create each task and append the task to the list
-    task1 = cotask.Task (wheel_L, name="Task_1", priority=3, period=6, profile=True, trace=False, \
-                         shares=(velocityL_ref, velocityL_meas, calibration_flag, Bump_flag, end_flag))
-    cotask.task_list.append(task1)
+    # Create an I2C object at 400 kHz and the IMU object, and set the IMU to
+    # NDOF mode
+    i2c = I2C(1, I2C.CONTROLLER, baudrate=400_000)
+    imu = BNO055(i2c, Pin.cpu.B9, Pin.cpu.B8, Pin.cpu.C9)
+    imu.set_mode(0x0C)
+    
+    # Create a sequence share for the heading, yaw rate, and time of each IMU
+    # sample, and the object which samples the IMU into it
+    imu_data = task_share.SeqShare('l', 3, name = "imu_data")
+    imu_sampler = IMUSampler(imu, imu_data)
     
-    task2 = cotask.Task (wheel_R, name="Task_2", priority=3, period=6, profile=True, trace=False, \
-                         shares=(velocityR_ref, velocityR_meas, calibration_flag, Bump_flag, end_flag))
-    cotask.task_list.append(task2)
+    # Create a sequence share for the x and y position, heading angle, and
+    # distance driven of the Romi
+    pose = task_share.SeqShare('f', 4, name = "pose")
     
-    task3 = cotask.Task (VelControl, name="Task_3", priority=2, period=8, profile=True, trace=False, \
-                         shares=(velocityL_ref, velocityL_meas, velocityR_ref, velocityR_meas, calibration_flag, Bump_flag, end_flag))
-    cotask.task_list.append(task3)
+    # Create share variables for the line position, the mask of black sensors,
+    # the time of the line sample, and the line sensor ready flag
+    line_pos = task_share.Share('h', thread_protect = False, name = "line_pos")
+    line_mask = task_share.Share('H', thread_protect = False, name = "line_mask")
+    line_time = task_share.Share('L', thread_protect = False, name = "line_time")
+    line_ready = task_share.Share('H', thread_protect = False, name = "line_ready")
+    
+    # Set MOTOR_ID to True to only run the motor identification task, with the
+    # Romi held off the ground, and fit the saved logs with motorfit.py
+    MOTOR_ID = False
+    # Set TUNE to 'L' or 'R' to auto-tune a wheel with the Romi held off the
+    # ground, or to 'yaw' to auto-tune the yaw rate with the Romi on the ground
+    TUNE = None
+    # Set TRACE_DUMP to True to write the state transitions of the tasks to the
+    # UART in binary when the scheduler is stopped, to be printed by tracedump.py
+    TRACE_DUMP = False
+    
+    # Create each task. The state transitions of the tasks which drive the
+    # course are recorded in ring buffers. A task which falls a period or more
+    # behind skips the runs it missed, so the controllers never run back to
+    # back on stale data.
+    # The IMU sampling task rebases its period instead, so after falling behind
+    # it waits a full 10 ms, the time between outputs of the sensor fusion,
+    # before reading the IMU again.
+    task0 = cotask.Task (MotorIdent, name="Task_0", priority=3, period=6, profile=True, trace=False)
+    
+    task1 = cotask.Task (wheel_L, name="Task_1", priority=3, period=6, profile=True, trace=True, \
+                         shares=(velocityL_ref, velocityL_meas, calibration_flag, Bump_flag, end_flag), \
+                         overrun=cotask.SKIP)
+    
+    task2 = cotask.Task (wheel_R, name="Task_2", priority=3, period=6, profile=True, trace=True, \
+                         shares=(velocityR_ref, velocityR_meas, calibration_flag, Bump_flag, end_flag), \
+                         overrun=cotask.SKIP)
+    
+    task3 = cotask.Task (VelControl, name="Task_3", priority=2, period=8, profile=True, trace=True, \
+                         shares=(velocityL_ref, velocityL_meas, velocityR_ref, velocityR_meas, calibration_flag, Bump_flag, end_flag, \
+                                 line_pos, line_mask, line_ready, imu_data, pose), \
+                         overrun=cotask.SKIP)
+    
+    task4 = cotask.Task (LineSense, name="Task_4", priority=2, period=6, profile=True, trace=True, \
+                         shares=(line_pos, line_mask, line_time, line_ready, calibration_flag), \
+                         overrun=cotask.SKIP)
+    
+    task5 = cotask.Task (IMUSample, name="Task_5", priority=2, period=10, profile=True, trace=True, \
+                         shares=(imu_data, calibration_flag), \
+                         overrun=cotask.REBASE)
+    
+    task6 = cotask.Task (PoseEstimate, name="Task_6", priority=2, period=6, profile=True, trace=True, \
+                         shares=(pose, imu_data, calibration_flag), \
+                         overrun=cotask.SKIP)
+    
+    # The yaw rate is tuned at the 8 ms period of the velocity control task
+    task7 = cotask.Task (AutoTune, name="Task_7", priority=2, period=8 if TUNE == 'yaw' else 6, profile=True, trace=False, \
+                         shares=(velocityL_ref, velocityL_meas, velocityR_ref, velocityR_meas, calibration_flag))
+    
+    # Append the tasks for the chosen mode to the list
+    if MOTOR_ID:
+        cotask.task_list.append(task0)
+    elif TUNE in ('L', 'R'):
+        cotask.task_list.append(task7)
+    elif TUNE == 'yaw':
+        cotask.task_list.append(task1)
+        cotask.task_list.append(task2)
+        cotask.task_list.append(task7)
+    else:
+        cotask.task_list.append(task1)
+        cotask.task_list.append(task2)
+        cotask.task_list.append(task3)
+        cotask.task_list.append(task4)
+        cotask.task_list.append(task5)
+        cotask.task_list.append(task6)
     
     
     gc.collect()
     
+    # Set TIMER_DISPATCH to True to release the tasks at exact period boundaries
+    # from a 1 ms Timer 5 interrupt, instead of when the scheduler checks the time
+    TIMER_DISPATCH = False
+    if TIMER_DISPATCH:
+        cotask.task_list.start_timer(Timer(5, freq = 1000))
+    
+    # Start measuring the idle time from when the scheduler starts
+    cotask.task_list.reset_idle()
+    
     # Run the Scheduler
     while True:
         try:
-            cotask.task_list.pri_sched()
+            # Sleep until the next interrupt when no task ran and none is due soon
+            if not cotask.task_list.pri_sched():
+                cotask.task_list.idle()
         except KeyboardInterrupt:
             break
         
     # Print a table of task data and a table of shared information data
     print('\n' + str (cotask.task_list))
+    if TIMER_DISPATCH:
+        cotask.task_list.stop_timer()
+        print(cotask.task_list.get_jitter())
+    print(imu_sampler)
+    if enc_sampler is not None:
+        print(enc_sampler)
     print('')
+    if TRACE_DUMP:
+        cotask.task_list.dump_traces(uart)
         
         
@@ -0,0 +1,152 @@
+'''!@file                          motorfit.py
+    @brief                         A program to fit the motor model to the logs from motorid.py.
+    @details                       A program run on a computer, not on the Nucleo, which reads the
+                                   CSV logs written by the MotorID class and fits a first order
+                                   model to each motor. The gain and static friction come from a
+                                   straight line fit of the steady state velocity of each duty cycle
+                                   step against the duty cycle, and the time constant comes from a
+                                   least squares fit of the discrete first order model
+                                   v[k+1] = a*v[k] + b*u[k] to the whole log. The models are written
+                                   to motor_ff.json, which is copied to the Nucleo and loaded by the
+                                   Feedforward class. Run it as: python motorfit.py id_L.csv id_R.csv
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+import sys
+import json
+from math import log
+
+## The smallest velocity in rad/s counted as the wheel turning
+MIN_VELOCITY = 0.5
+
+## The fraction of each duty cycle step which is skipped before the velocity is averaged
+SETTLE_FRACTION = 0.5
+
+def read_log(filename):
+    '''!@brief                          Reads a log written by MotorID.save().
+        @param filename                 The name of the CSV file
+        @return                         Lists of the times in ms, duty cycles in percent, and velocities
+                                        in rad/s
+    '''
+    times = []
+    duties = []
+    velocities = []
+    with open(filename) as log_file:
+        log_file.readline()
+        for line in log_file:
+            if not line.strip():
+                continue
+            time, duty, velocity = line.split(',')
+            times.append(int(time))
+            duties.append(int(duty))
+            velocities.append(float(velocity))
+    return times, duties, velocities
+
+def steady_states(duties, velocities, min_length=40):
+    '''!@brief                          Finds the steady state velocity of each duty cycle step.
+        @details                        A step is a run of at least min_length samples at the same nonzero
+                                        duty cycle. The velocity is averaged over the end of the step, after
+                                        the motor has settled. The chirp changes the duty cycle every sample,
+                                        so it has no steps.
+        @param duties                   The logged duty cycles
+        @param velocities               The logged velocities
+        @param min_length               The fewest samples in a step
+        @return                         A list of (duty, velocity) pairs, one for each step
+    '''
+    points = []
+    start = 0
+    for n in range(1, len(duties) + 1):
+        if n < len(duties) and duties[n] == duties[start]:
+            continue
+        length = n - start
+        if duties[start] != 0 and length >= min_length:
+            settled = velocities[start + int(length*SETTLE_FRACTION):n]
+            points.append((duties[start], sum(settled)/len(settled)))
+        start = n
+    return points
+
+def fit_gain(points):
+    '''!@brief                          Fits the gain and static friction to the steady state velocities.
+        @details                        The steady state speed is modeled as K*(|duty| - static) once the
+                                        duty cycle is above the static friction, so a straight line is fit
+                                        to the speed against the size of the duty cycle. Steps where the
+                                        wheel didn't turn are left out.
+        @param points                   The (duty, velocity) pairs from steady_states()
+        @return                         The gain K in rad/s per percent duty and the static friction duty
+                                        cycle in percent
+    '''
+    xs = []
+    ys = []
+    for duty, velocity in points:
+        if abs(velocity) >= MIN_VELOCITY:
+            xs.append(abs(duty))
+            ys.append(abs(velocity))
+    if len(xs) < 2:
+        raise ValueError("Not enough steps with the wheel turning to fit the gain")
+    num = len(xs)
+    mean_x = sum(xs)/num
+    mean_y = sum(ys)/num
+    s_xx = sum((x - mean_x)**2 for x in xs)
+    s_xy = sum((x - mean_x)*(y - mean_y) for x, y in zip(xs, ys))
+    K = s_xy/s_xx
+    static = mean_x - mean_y/K
+    return K, max(static, 0.0)
+
+def fit_tau(times, duties, velocities, static):
+    '''!@brief                          Fits the time constant to the whole log.
+        @details                        The duty cycle above the static friction, u, drives the first order
+                                        model v[k+1] = a*v[k] + b*u[k]. The least squares a gives the time
+                                        constant tau = -dt/ln(a), where dt is the average sample period.
+        @param times                    The logged times in ms
+        @param duties                   The logged duty cycles
+        @param velocities               The logged velocities
+        @param static                   The static friction duty cycle from fit_gain()
+        @return                         The time constant in seconds
+    '''
+    s_vv = s_vu = s_uu = s_nv = s_nu = 0.0
+    for k in range(len(velocities) - 1):
+        duty = duties[k]
+        if duty > static:
+            u = duty - static
+        elif duty < -static:
+            u = duty + static
+        else:
+            u = 0.0
+        v = velocities[k]
+        v_next = velocities[k + 1]
+        s_vv += v*v
+        s_vu += v*u
+        s_uu += u*u
+        s_nv += v_next*v
+        s_nu += v_next*u
+    det = s_vv*s_uu - s_vu*s_vu
+    if det == 0:
+        raise ValueError("The log doesn't excite the motor enough to fit the time constant")
+    a = (s_nv*s_uu - s_nu*s_vu)/det
+    if not 0 < a < 1:
+        raise ValueError(f"The fitted pole {a:.3f} isn't a stable first order response")
+    dt = (times[-1] - times[0])/(len(times) - 1)/1000
+    return -dt/log(a)
+
+def fit(filename):
+    '''!@brief                          Fits the motor model to one log.
+        @param filename                 The name of the CSV file
+        @return                         A dictionary with the gain K, time constant tau, and static friction
+    '''
+    times, duties, velocities = read_log(filename)
+    K, static = fit_gain(steady_states(duties, velocities))
+    tau = fit_tau(times, duties, velocities, static)
+    return {'K': round(K, 5), 'tau': round(tau, 5), 'static': round(static, 3)}
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python motorfit.py id_L.csv id_R.csv")
+        sys.exit(1)
+    models = {'L': fit(sys.argv[1]), 'R': fit(sys.argv[2])}
+    for side in models:
+        model = models[side]
+        print(f"{side}: K = {model['K']} rad/s per %, tau = {model['tau']} s, static = {model['static']} %")
+    with open('motor_ff.json', 'w') as ff_file:
+        json.dump(models, ff_file)
+    print("Wrote motor_ff.json")
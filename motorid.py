@@ -0,0 +1,198 @@
+'''!@file                          motorid.py
+    @brief                         Classes to identify the motor model and use it for feedforward.
+    @details                       A file with the MotorID class, which drives one motor through
+                                   a schedule of duty cycle steps and a chirp while logging the
+                                   encoder velocity, and the Feedforward class, which turns the
+                                   motor model fitted to that log by motorfit.py into the duty
+                                   cycle needed for a reference velocity. With the feedforward, the
+                                   wheel PI controllers only have to correct the small error left
+                                   instead of integrating up to the whole duty cycle after every
+                                   change in the reference.
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+from array import array
+from math import sin, pi
+import json
+from time import ticks_us, ticks_ms, ticks_diff
+from velestimator import VelEstimator
+
+## The default identification schedule: steps up and down through the duty cycles in both
+#  directions, then a chirp around 30% duty from 0.5 Hz to 5 Hz. Each step is
+#  ('step', time in ms, duty) and the chirp is ('chirp', time in ms, offset, amplitude,
+#  start frequency, end frequency).
+SCHEDULE = (('step', 500, 0), ('step', 800, 15), ('step', 800, 30), ('step', 800, 45),
+            ('step', 800, 60), ('step', 800, 30), ('step', 500, 0), ('step', 800, -30),
+            ('step', 800, -60), ('step', 500, 0), ('chirp', 4000, 30, 15, 0.5, 5.0),
+            ('step', 500, 0))
+
+class MotorID:
+    '''!@brief                          A class to log the response of one motor to a duty cycle schedule.
+        @details                        Objects of this class are run by a task. Each run, sample() sets the
+                                        duty cycle for the current time in the schedule and logs the time,
+                                        duty cycle, and encoder velocity into arrays which were created with
+                                        the object. The velocity is found by a VelEstimator, the same way as
+                                        in the wheel tasks, so the fitted model matches the velocity the
+                                        controllers are given. Once the schedule is done, save() writes the log to a
+                                        CSV file which motorfit.py can fit on a computer.
+    '''
+
+    def __init__(self, mot, enc, schedule=SCHEDULE, period=6):
+        '''!@brief                      Creates an object of the MotorID class.
+            @param mot                  The MotorDriver object of the motor
+            @param enc                  The Encoder_romi object of the motor
+            @param schedule             The tuple of steps and chirps to run
+            @param period               The period in ms of the task which runs sample(), used to size the log
+        '''
+        self.mot = mot
+        self.enc = enc
+        self.est = VelEstimator()
+        self.schedule = schedule
+        total = 0
+        for segment in schedule:
+            total += segment[1]
+        self.total_ms = total
+        # Create the log arrays with room for every period of the schedule
+        size = total//period + 16
+        self.size = size
+        self.times = array('H', size*[0])
+        self.duties = array('b', size*[0])
+        self.velocities = array('h', size*[0])
+        self.num_samples = 0
+        self.start_time = None
+        self.last_duty = 0
+
+    def duty_at(self, t):
+        '''!@brief                      Finds the duty cycle at a time in the schedule.
+            @param t                    The time since the start of the schedule in ms
+            @return                     The duty cycle in percent, or None once the schedule is done
+        '''
+        for segment in self.schedule:
+            if t < segment[1]:
+                if segment[0] == 'step':
+                    return segment[2]
+                # The chirp frequency rises linearly from the start to the end frequency
+                kind, length, offset, amplitude, f_0, f_1 = segment
+                seconds = t/1000
+                rate = (f_1 - f_0)/(length/1000)
+                return offset + amplitude*sin(2*pi*(f_0*seconds + rate*seconds*seconds/2))
+            t -= segment[1]
+        return None
+
+    def sample(self):
+        '''!@brief                      Sets the duty cycle and logs one sample.
+            @return                     True while the schedule is running, False once it is done
+        '''
+        now = ticks_ms()
+        self.enc.update()
+        velocity = self.est.update(self.enc.get_position(), ticks_us())
+        if self.start_time is None:
+            self.start_time = now
+        t = ticks_diff(now, self.start_time)
+        duty = self.duty_at(t)
+        if duty is None or self.num_samples >= self.size:
+            self.mot.set_duty(0)
+            return False
+        # Log the duty cycle set last period with the velocity it produced
+        n = self.num_samples
+        self.times[n] = t
+        self.duties[n] = self.last_duty
+        self.velocities[n] = velocity
+        self.num_samples = n + 1
+
+        self.mot.set_duty(duty)
+        self.last_duty = int(duty)
+        return True
+
+    def save(self, filename):
+        '''!@brief                      Writes the log to a CSV file.
+            @details                    Each line has the time in ms, the duty cycle in percent, and the
+                                        velocity in rad/s.
+            @param filename             The name of the file to write
+        '''
+        with open(filename, 'w') as log_file:
+            log_file.write('time_ms,duty,velocity\n')
+            for n in range(self.num_samples):
+                log_file.write(f'{self.times[n]},{self.duties[n]},{self.velocities[n]*(2*3.1415/1440):.4f}\n')
+
+class Feedforward:
+    '''!@brief                          A class to find the feedforward duty cycle of one motor.
+        @details                        The motor model fitted by motorfit.py has a gain K in rad/s per
+                                        percent duty, a time constant tau in seconds, and a static friction
+                                        duty cycle which must be overcome before the wheel turns. The
+                                        steady state duty cycle for a velocity is the static friction duty
+                                        in the direction of motion plus the velocity divided by K.
+                                        The reference from the velocity control task changes in steps, so it
+                                        is shaped by a first order prefilter with the time constant tau_ref
+                                        before it is used. The feedforward duty cycle is the steady state
+                                        duty cycle of the shaped reference plus a lead term of tau times its
+                                        rate of change divided by K, which gives the motor the extra duty
+                                        cycle it needs to follow the shaped reference. The lead on a step is
+                                        at most tau/tau_ref times the step, rather than a spike of tau/dt
+                                        times the step in a single period, and noise in the reference is
+                                        filtered. The shaped reference is given to the wheel controller so
+                                        the feedback doesn't fight the feedforward. If no model has been
+                                        saved, the feedforward is zero and the reference isn't shaped.
+    '''
+
+    def __init__(self, K=0, tau=0, static=0, tau_ref=0.03):
+        '''!@brief                      Creates an object of the Feedforward class.
+            @param K                    The motor gain in rad/s per percent duty, or 0 for no feedforward
+            @param tau                  The motor time constant in seconds
+            @param static               The static friction duty cycle in percent
+            @param tau_ref              The time constant in seconds of the reference prefilter
+        '''
+        self.K = K
+        self.tau = tau
+        self.static = static
+        self.tau_ref = tau_ref
+        # The shaped reference velocity and its rate of change
+        self.ref = 0
+        self.rate = 0
+
+    def load(self, side, filename='motor_ff.json'):
+        '''!@brief                      Loads the model of one motor saved by motorfit.py.
+            @param side                 'L' or 'R' for the left or right motor
+            @param filename             The name of the file with the motor models
+            @return                     True if the model was loaded, False if it was not
+        '''
+        try:
+            with open(filename) as ff_file:
+                model = json.load(ff_file)[side]
+        except (OSError, ValueError, KeyError):
+            return False
+        self.K = model['K']
+        self.tau = model['tau']
+        self.static = model['static']
+        return True
+
+    def steady(self, vel):
+        '''!@brief                      Finds the steady state duty cycle for a velocity.
+            @param vel                  The velocity of the wheel in rad/s
+            @return                     The duty cycle in percent which holds the wheel at that velocity
+        '''
+        if self.K == 0 or vel == 0:
+            return 0
+        if vel > 0:
+            return self.static + vel/self.K
+        return -self.static + vel/self.K
+
+    def duty(self, vel_ref, dt):
+        '''!@brief                      Shapes the reference velocity and finds its feedforward duty cycle.
+            @details                    The prefilter only moves the shaped reference when dt is above
+                                        zero. Without a model, the shaped reference is the reference.
+                                        After this is called, the shaped reference is in the ref attribute.
+            @param vel_ref              The reference velocity of the wheel in rad/s
+            @param dt                   The time in seconds since the last update, or 0 if there is no
+                                        new sample
+            @return                     The feedforward duty cycle in percent
+        '''
+        if self.K == 0:
+            self.ref = vel_ref
+            return 0
+        if dt > 0:
+            # The rate of change of the shaped reference over this step
+            self.rate = (vel_ref - self.ref)/(self.tau_ref + dt)
+            self.ref += self.rate*dt
+        return self.steady(self.ref) + self.tau*self.rate/self.K
@@ -0,0 +1,172 @@
+'''!@file                          odometry.py
+    @brief                         Classes to track the pose of the robot and move it by distance or angle.
+    @details                       A file with the Odometry class, which finds the position and
+                                   heading of the Romi from the encoder positions and the IMU
+                                   heading, and the Move class, which uses that pose to tell when
+                                   a move of a set distance or angle is done. The pose is shared
+                                   between tasks with a SeqShare holding the x and y position, the
+                                   heading angle, and the distance driven.
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+from array import array
+from math import sin, cos, pi
+from time import ticks_ms, ticks_diff
+
+## Index of the x position in meters in the pose share
+X = 0
+## Index of the y position in meters in the pose share
+Y = 1
+## Index of the heading angle in radians, counterclockwise from the start, in the pose share
+THETA = 2
+## Index of the distance driven in meters, negative when driving backward, in the pose share
+DIST = 3
+
+## Scale from the raw BNO055 heading, in sixteenths of a degree clockwise, to radians counterclockwise
+HEADING_SCALE = -pi/(180*16)
+
+class Odometry:
+    '''!@brief                          A class to find the pose of the Romi robot.
+        @details                        Objects of this class take the encoder positions of both wheels and,
+                                        when there is one, the raw IMU heading each update. The distance
+                                        driven comes from the encoders, and the change in heading comes from
+                                        the IMU, or from the difference of the wheel distances if there is no
+                                        IMU heading. The pose is integrated at the middle heading of each
+                                        update and written to a SeqShare so that other tasks can read it.
+    '''
+
+    def __init__(self, share, r_w=0.035, w=0.141, counts_per_rev=1440):
+        '''!@brief                      Creates an object of the Odometry class.
+            @param share                A task_share.SeqShare of type 'f' and size 4 for the pose
+            @param r_w                  The wheel radius in meters
+            @param w                    The track width in meters
+            @param counts_per_rev       The number of encoder counts in one turn of a wheel
+        '''
+        self.share = share
+        self.w = w
+        self.m_per_count = 2*pi*r_w/counts_per_rev
+        # Create the pose array holding the x and y position, heading angle, and distance
+        self.pose = array('f', [0, 0, 0, 0])
+        self.last_L = 0
+        self.last_R = 0
+        self.last_heading = None
+
+    def reset(self, pos_L, pos_R):
+        '''!@brief                      Sets the pose back to zero at the current encoder positions.
+            @param pos_L                The position of the left encoder in counts
+            @param pos_R                The position of the right encoder in counts
+        '''
+        self.last_L = pos_L
+        self.last_R = pos_R
+        self.last_heading = None
+        for n in range(4):
+            self.pose[n] = 0
+        self.publish()
+
+    def update(self, pos_L, pos_R, heading_raw=None):
+        '''!@brief                      Updates the pose from the encoder positions and IMU heading.
+            @details                    The change in heading is taken from the IMU heading if one is given,
+                                        wrapping around at 360 degrees, and from the wheel distances if not.
+            @param pos_L                The position of the left encoder in counts
+            @param pos_R                The position of the right encoder in counts
+            @param heading_raw          The raw BNO055 heading in sixteenths of a degree, or None if there is
+                                        no new IMU heading
+        '''
+        pose = self.pose
+        dist_L = (pos_L - self.last_L)*self.m_per_count
+        dist_R = (pos_R - self.last_R)*self.m_per_count
+        self.last_L = pos_L
+        self.last_R = pos_R
+        dist = (dist_L + dist_R)/2
+
+        if heading_raw is None or self.last_heading is None:
+            d_theta = (dist_R - dist_L)/self.w
+        else:
+            # Wrap the change in heading to +/- 180 degrees
+            d_heading = heading_raw - self.last_heading
+            if d_heading > 2880:
+                d_heading -= 5760
+            elif d_heading < -2880:
+                d_heading += 5760
+            d_theta = d_heading*HEADING_SCALE
+        if heading_raw is not None:
+            self.last_heading = heading_raw
+
+        # Move along the heading halfway through the update
+        theta = pose[THETA]
+        mid_theta = theta + d_theta/2
+        pose[X] += dist*cos(mid_theta)
+        pose[Y] += dist*sin(mid_theta)
+        pose[THETA] = theta + d_theta
+        pose[DIST] += dist
+        self.publish()
+
+    def publish(self):
+        '''!@brief                      Writes the pose to the share.
+        '''
+        share = self.share
+        pose = self.pose
+        share.begin_write()
+        for n in range(4):
+            share.write(n, pose[n])
+        share.end_write()
+
+class Move:
+    '''!@brief                          A class to move the Romi robot by a distance or angle.
+        @details                        Objects of this class remember one value of the pose when a move is
+                                        started, and report the move as done once that value has changed by
+                                        the target amount. Each move also has a timeout, so that a move which
+                                        is blocked or can't be measured still ends.
+    '''
+
+    def __init__(self, share):
+        '''!@brief                      Creates an object of the Move class.
+            @param share                The task_share.SeqShare the pose is written to by an Odometry object
+        '''
+        self.share = share
+        self.pose = array('f', [0, 0, 0, 0])
+        self.index = DIST
+        self.target = 0.0
+        self.start_value = 0.0
+        self.start_time = 0
+        self.timeout = 0
+        self.timed_out = False
+
+    def start(self, index, target, timeout):
+        '''!@brief                      Starts a move.
+            @param index                The index of the pose value to move, DIST for a distance or THETA
+                                        for an angle
+            @param target               The change in the pose value to move by, in meters or radians.
+                                        Negative values move backward or clockwise.
+            @param timeout              The longest time in milliseconds the move can take
+        '''
+        self.share.read(self.pose)
+        self.index = index
+        self.target = target
+        self.start_value = self.pose[index]
+        self.start_time = ticks_ms()
+        self.timeout = timeout
+        self.timed_out = False
+
+    def progress(self):
+        '''!@brief                      Gets how far the move has gone.
+            @return                     The change in the pose value since the move was started
+        '''
+        self.share.read(self.pose)
+        return self.pose[self.index] - self.start_value
+
+    def done(self):
+        '''!@brief                      Checks if the move is done.
+            @return                     True if the target has been reached or the move has timed out,
+                                        False if it has not
+        '''
+        moved = self.progress()
+        if self.target < 0:
+            moved = -moved
+        if moved >= abs(self.target):
+            return True
+        if ticks_diff(ticks_ms(), self.start_time) >= self.timeout:
+            self.timed_out = True
+            return True
+        return False
@@ -0,0 +1,212 @@
+'''!@file                          pid.py
+    @brief                         A general controller for all of the control loops of the robot.
+    @details                       A PID controller class which can be set up as the P, PI, or PID
+                                   controller of any loop on the Romi, in place of a separate class
+                                   for each loop. It uses the measured time step, limits the
+                                   integral with back-calculation anti-windup, filters the
+                                   derivative, limits how fast the output can change, and adds
+                                   feedforward. Running this file on the Nucleo times it against
+                                   the PI controller the wheels used before it.
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+from array import array
+
+## Index of the integral term in the controller state
+_INTEGRAL = 0
+## Index of the filtered derivative term in the controller state
+_DERIV = 1
+## Index of the last measured value in the controller state
+_LAST_MEAS = 2
+## Index of the last output in the controller state
+_LAST_OUT = 3
+## Index of the flag set once there is a last measured value in the controller state
+_PRIMED = 4
+
+class PID:
+    '''!@brief                          A PID controller with anti-windup, derivative filter, slew limit, and feedforward.
+        @details                        The output is the sum of the proportional, integral, and derivative
+                                        terms and the feedforward, limited to the output range and slew rate.
+                                        The derivative is taken of the measured value rather than the error,
+                                        so a step in the reference doesn't kick the output, and is passed
+                                        through a first order filter. While the output is limited, the
+                                        error isn't integrated in the direction of the limit, and the
+                                        difference between the limited and unlimited output is fed back to
+                                        unwind the integral toward zero, so it doesn't wind up. The integral, filter,
+                                        and last values are kept in an array so that an update doesn't
+                                        create any attributes.
+    '''
+    __slots__ = ('K_p', 'K_i', 'K_d', 'K_ff', 'K_aw', 'tau_d', 'out_min', 'out_max', 'slew', 'state')
+
+    def __init__(self, K_p, K_i=0, K_d=0, K_ff=0, out_min=None, out_max=None, slew=None, K_aw=None, tau_d=0.02):
+        '''!@brief                      Creates an object of the PID class.
+            @param K_p                  The proportional gain
+            @param K_i                  The integral gain
+            @param K_d                  The derivative gain
+            @param K_ff                 The feedforward gain, which multiplies the reference
+            @param out_min              The smallest output, or None for no limit
+            @param out_max              The largest output, or None for no limit
+            @param slew                 The largest change of the output per second, or None for no limit
+            @param K_aw                 The back-calculation anti-windup gain, one over the time it takes
+                                        the integral to unwind. It defaults to 10*K_i/K_p, a tenth of the
+                                        integral time, or to zero if there is no proportional gain.
+            @param tau_d                The time constant in seconds of the derivative filter
+        '''
+        self.set_gains(K_p, K_i, K_aw)
+        self.K_d = K_d
+        self.K_ff = K_ff
+        self.tau_d = tau_d
+        self.out_min = out_min
+        self.out_max = out_max
+        self.slew = slew
+        self.state = array('f', 5*[0])
+
+    def set_gains(self, K_p, K_i=0, K_aw=None):
+        '''!@brief                      Sets the proportional and integral gains and the anti-windup gain.
+            @param K_p                  The proportional gain
+            @param K_i                  The integral gain
+            @param K_aw                 The back-calculation anti-windup gain, or None for 10*K_i/K_p, or
+                                        zero if there is no proportional gain
+        '''
+        self.K_p = K_p
+        self.K_i = K_i
+        if K_aw is None:
+            K_aw = 10*K_i/K_p if K_p else 0
+        self.K_aw = K_aw
+
+    def reset(self):
+        '''!@brief                      Sets the integral, derivative filter, and last output back to zero.
+        '''
+        state = self.state
+        for n in range(5):
+            state[n] = 0
+
+    def update(self, ref, meas, dt, ff=0):
+        '''!@brief                      Finds the controller output.
+            @details                    If dt is zero, such as when there is no new measurement, the integral,
+                                        derivative, and slew limit are left as they were and only the
+                                        proportional term and feedforward follow the new values.
+            @param ref                  The reference value
+            @param meas                 The measured value
+            @param dt                   The time in seconds since the last update
+            @param ff                   A feedforward value added to the output, such as from a motor model
+            @return                     The controller output
+        '''
+        state = self.state
+        error = ref - meas
+
+        # Filter the derivative of the measured value
+        if dt > 0 and self.K_d:
+            if state[_PRIMED]:
+                alpha = dt/(self.tau_d + dt)
+                state[_DERIV] += alpha*(-self.K_d*(meas - state[_LAST_MEAS])/dt - state[_DERIV])
+            state[_LAST_MEAS] = meas
+            state[_PRIMED] = 1
+
+        unlimited = self.K_p*error + state[_INTEGRAL] + state[_DERIV] + self.K_ff*ref + ff
+
+        # Limit how fast the output can change, then limit the output range
+        out = unlimited
+        if self.slew is not None and dt > 0:
+            step = self.slew*dt
+            last_out = state[_LAST_OUT]
+            if out > last_out + step:
+                out = last_out + step
+            elif out < last_out - step:
+                out = last_out - step
+        if self.out_max is not None and out > self.out_max:
+            out = self.out_max
+        elif self.out_min is not None and out < self.out_min:
+            out = self.out_min
+
+        if dt > 0:
+            # Don't integrate the error while it pushes the output further into a limit
+            limited = out - unlimited
+            integral = state[_INTEGRAL]
+            if limited == 0 or (limited < 0) != (error > 0):
+                integral += self.K_i*error*dt
+            # Unwind the integral by the amount the output was limited, but not past zero
+            if limited < 0 and integral > 0:
+                integral += self.K_aw*limited*dt
+                if integral < 0:
+                    integral = 0
+            elif limited > 0 and integral < 0:
+                integral += self.K_aw*limited*dt
+                if integral > 0:
+                    integral = 0
+            state[_INTEGRAL] = integral
+            state[_LAST_OUT] = out
+        return out
+
+def update_pair(cont_L, cont_R, ref_L, meas_L, ref_R, meas_R, dt, out, ff_L=0, ff_R=0):
+    '''!@brief                          Updates the controllers of both wheels together.
+        @details                        Updates both controllers with the same time step and puts both outputs
+                                        into an array, so that no tuple is created to return them.
+        @param cont_L                   The PID object of the left wheel
+        @param cont_R                   The PID object of the right wheel
+        @param ref_L                    The reference velocity of the left wheel
+        @param meas_L                   The measured velocity of the left wheel
+        @param ref_R                    The reference velocity of the right wheel
+        @param meas_R                   The measured velocity of the right wheel
+        @param dt                       The time in seconds since the last update
+        @param out                      An array of at least 2 items for the left and right outputs
+        @param ff_L                     A feedforward value added to the left output
+        @param ff_R                     A feedforward value added to the right output
+        @return                         The out array
+    '''
+    out[0] = cont_L.update(ref_L, meas_L, dt, ff_L)
+    out[1] = cont_R.update(ref_R, meas_R, dt, ff_R)
+    return out
+
+if __name__ == "__main__":
+    from time import ticks_us, ticks_diff
+
+    class _OldPI:
+        # The PI controller of each wheel used before the PID class, kept here
+        # so the benchmark can time it
+        def __init__(self, K_p, K_i):
+            self.K_p = K_p
+            self.K_i = K_i
+            self.integral = 0
+
+        def duty(self, vel_ref, vel_meas, dt=0.006):
+            self.error = vel_ref - vel_meas
+            self.integral += self.error * dt
+            self.L = self.K_p*self.error + self.K_i*self.integral
+            self.L = max(min(self.L, 100), -100)
+            return self.L
+
+    # Compare the time taken by the old wheel controllers and by the PID class
+    # set up the same way, for one wheel and for both wheels together
+    num_runs = 1000
+    old_L = _OldPI(2.5, 0.5)
+    old_R = _OldPI(2.2, 0.5)
+    start = ticks_us()
+    for run in range(num_runs):
+        old_L.duty(10.0, 9.5)
+    old_time = ticks_diff(ticks_us(), start)
+
+    cont_L = PID(2.5, 0.5, out_min=-100, out_max=100)
+    cont_R = PID(2.2, 0.5, out_min=-100, out_max=100)
+    start = ticks_us()
+    for run in range(num_runs):
+        cont_L.update(10.0, 9.5, 0.006)
+    new_time = ticks_diff(ticks_us(), start)
+
+    start = ticks_us()
+    for run in range(num_runs):
+        old_L.duty(10.0, 9.5)
+        old_R.duty(10.0, 9.5)
+    old_pair_time = ticks_diff(ticks_us(), start)
+
+    out = array('f', [0, 0])
+    start = ticks_us()
+    for run in range(num_runs):
+        update_pair(cont_L, cont_R, 10.0, 9.5, 10.0, 9.5, 0.006, out)
+    new_pair_time = ticks_diff(ticks_us(), start)
+
+    print(f"Old PI controller:     {old_time/num_runs:.1f} us per update")
+    print(f"PID:                   {new_time/num_runs:.1f} us per update")
+    print(f"Both old controllers:  {old_pair_time/num_runs:.1f} us per update")
+    print(f"update_pair:           {new_pair_time/num_runs:.1f} us per update")
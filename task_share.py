@@ -410,3 +410,131 @@ class Share (BaseShare):
                 type_code_strings[self._type_code]))
 
 
+
+
+# ============================================================================
+
+## A group of related data items which are always read together.
+#  This class holds several values of one type, such as a heading, a rate, and
+#  the time at which they were measured, which must be read as a consistent
+#  set. Instead of disabling interrupts, it uses a sequence counter in the
+#  style of a seqlock: the writer makes the counter odd while it is changing
+#  the values and even again when it is done, and a reader copies the values
+#  and retries if the counter was odd or changed while it was copying. Readers
+#  therefore never block the writer, which may be a task or an ISR, and no
+#  memory is allocated by either side.
+# 
+#  An example of the creation and use of a sequence share is as follows:
+#  @code
+#  import task_share
+# 
+#  # This share holds three signed 32-bit integers
+#  imu_data = task_share.SeqShare ('l', 3, name="IMU Data")
+# 
+#  # Somewhere in one task, write a set of values into the share
+#  imu_data.begin_write ()
+#  imu_data.write (0, heading)
+#  imu_data.write (1, yaw_rate)
+#  imu_data.write (2, time_stamp)
+#  imu_data.end_write ()
+# 
+#  # In another task, copy a consistent set of values into an array
+#  values = array.array ('l', 3 * [0])
+#  seq_num = imu_data.read (values)
+#  @endcode
+class SeqShare (BaseShare):
+
+    ## A counter used to give serial numbers to sequence shares.
+    ser_num = 0
+
+
+    ## Create a sequence share to transfer sets of data between tasks.
+    # 
+    #  @param type_code The type of data items which the share can hold, as
+    #         for a @c Share
+    #  @param size The number of data items in each set
+    #  @param name A short name for the share, default @c SeqShareN where
+    #         @c N is a serial number for the share
+    def __init__ (self, type_code, size, name = None):
+        # First call the parent class initializer
+        super ().__init__ (type_code, False, name)
+
+        self._buffer = array.array (type_code, size * [0])
+        self._size = size
+        self._seq = array.array ('H', [0])
+
+        self._name = str (name) if name != None \
+            else 'SeqShare' + str (SeqShare.ser_num)
+        SeqShare.ser_num += 1
+
+
+    ## Start writing a new set of values into the share.
+    # 
+    #  The sequence number is made odd so that readers know that the values
+    #  are being changed.
+    @micropython.native
+    def begin_write (self):
+        self._seq[0] = (self._seq[0] + 1) & 0xFFFF
+
+
+    ## Write one value of the set into the share.
+    #  This must be called between @c begin_write() and @c end_write().
+    #  @param index The index of the value in the set
+    #  @param data The value to be put into the share
+    @micropython.native
+    def write (self, index, data):
+        self._buffer[index] = data
+
+
+    ## Finish writing a set of values into the share.
+    # 
+    #  The sequence number is made even again, which tells readers that the
+    #  new set of values is complete.
+    @micropython.native
+    def end_write (self):
+        self._seq[0] = (self._seq[0] + 1) & 0xFFFF
+
+
+    ## Copy a consistent set of values from the share.
+    # 
+    #  If the writer changes the values while they are being copied, which
+    #  can only happen when the writer is an ISR, the copy is made again.
+    #  @param values An array of at least @c size items into which the values
+    #         are copied
+    #  @return The sequence number of the set of values copied, which can be
+    #         compared with an earlier one to see if new data has arrived
+    @micropython.native
+    def read (self, values):
+        seq = self._seq
+        buffer = self._buffer
+        while True:
+            start = seq[0]
+            if start & 1:
+                continue
+            for index in range (self._size):
+                values[index] = buffer[index]
+            if seq[0] == start:
+                return start
+
+
+    ## Read one value from the share.
+    # 
+    #  A single value can be read without a retry, as it is written in one
+    #  step; use @c read() when several values must match each other.
+    #  @param index The index of the value in the set
+    def get (self, index):
+        return self._buffer[index]
+
+
+    ## Get the sequence number of the most recent set of values.
+    # 
+    #  The sequence number goes up by two for each new set of values and wraps
+    #  around at 65536, so it stays a small integer.
+    def seq_num (self):
+        return self._seq[0]
+
+
+    ## Puts diagnostic information about the sequence share into a string.
+    def __repr__ (self):
+        return ("{:<12s} SeqShare<{:s}> [{:d}], seq {:d}".format (self._name,
+                type_code_strings[self._type_code], self._size, self._seq[0]))
@@ -0,0 +1,269 @@
+'''!@file                          test_linesensor.py
+    @brief                         Host tests of the parallel read of the line sensor array.
+    @details                       A file with fake GPIO ports which model the mode and input data
+                                   registers that the LineSensorArray class switches and reads
+                                   through the stm module. Each fake sensor stays high while its
+                                   pin is an output and falls a set time after its pin is switched
+                                   to an input, with a different time while the emitters are off,
+                                   so the decay timing, saturation, and ambient compensation can be
+                                   checked on a computer. The BNO055 emulator installs the fake pyb
+                                   and micropython modules. Run it with pytest.
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+import sys
+import types
+
+import bno055emu
+
+## The time in microseconds the fake clock moves on each call to ticks_us()
+STEP_US = 5
+
+## The offset of the mode register in each fake GPIO port
+GPIO_MODER = 0x00
+## The offset of the input data register in each fake GPIO port
+GPIO_IDR = 0x10
+
+class FakeClock:
+    '''!@brief                          A microsecond clock which moves on each time it is read.
+        @details                        The line sensor array polls the ports in a loop until every channel
+                                        has fallen, so each read of the clock stands for one pass of that
+                                        loop.
+    '''
+
+    def __init__(self):
+        '''!@brief                      Creates a clock at zero.
+        '''
+        self.now = 0
+
+    def ticks_us(self):
+        '''!@brief                      Reads the clock and moves it on by one step.
+            @return                     The time in microseconds
+        '''
+        self.now += STEP_US
+        return self.now
+
+    def sleep_us(self, us):
+        '''!@brief                      Moves the clock on by a delay.
+            @param us                   The delay in microseconds
+        '''
+        self.now += us
+
+class FakePort:
+    '''!@brief                          A GPIO port with the mode and input data registers of the sensors.
+        @details                        Pins in output mode (0b01) read their high output latch. When a
+                                        pin is switched to input mode (0b00), the time is recorded, and it
+                                        reads high until its decay time has passed.
+    '''
+
+    def __init__(self, board, base):
+        '''!@brief                      Creates a port with every pin in analog mode, as after a reset.
+            @param board                The FakeBoard the port belongs to
+            @param base                 The address of the port
+        '''
+        self.board = board
+        self.base = base
+        self.moder = 0xFFFFFFFF
+        self.released = {}
+        self.decay_on = {}
+        self.decay_off = {}
+
+    def write_moder(self, value):
+        '''!@brief                      Writes the mode register and records the pins released to inputs.
+            @param value                The new 32 bit mode register
+        '''
+        for pin in self.decay_on:
+            old = (self.moder >> 2*pin) & 0b11
+            new = (value >> 2*pin) & 0b11
+            if old == 0b01 and new == 0b00:
+                self.released[pin] = self.board.clock.now
+        self.moder = value
+
+    def read_idr(self):
+        '''!@brief                      Reads the input data register.
+            @return                     The level of each sensor pin in its bit
+        '''
+        now = self.board.clock.now
+        decay = self.decay_on if self.board.emitters_on else self.decay_off
+        idr = 0
+        for pin in self.decay_on:
+            mode = (self.moder >> 2*pin) & 0b11
+            if mode == 0b01 or (mode == 0b00 and now - self.released[pin] < decay[pin]):
+                idr |= 1 << pin
+        return idr
+
+class FakeMem:
+    '''!@brief                          The stm.mem16 or stm.mem32 view of the fake ports.
+    '''
+
+    def __init__(self, board, size):
+        '''!@brief                      Creates a view of the ports.
+            @param board                The FakeBoard with the ports
+            @param size                 The number of bytes in each access, 2 or 4
+        '''
+        self.board = board
+        self.size = size
+
+    def __getitem__(self, addr):
+        port, offset = self.board.find(addr)
+        if offset == GPIO_IDR:
+            return port.read_idr()
+        value = port.moder if self.size == 4 else port.moder >> 8*(offset - GPIO_MODER)
+        return value & ((1 << 8*self.size) - 1)
+
+    def __setitem__(self, addr, value):
+        port, offset = self.board.find(addr)
+        if self.size == 4:
+            port.write_moder(value & 0xFFFFFFFF)
+        else:
+            shift = 8*(offset - GPIO_MODER)
+            port.write_moder((port.moder & ~(0xFFFF << shift)) | ((value & 0xFFFF) << shift))
+
+class FakeBoard:
+    '''!@brief                          The fake ports, clock, and emitters of one test.
+    '''
+
+    def __init__(self):
+        '''!@brief                      Creates the ports A and B with the emitters on.
+        '''
+        self.clock = FakeClock()
+        self.ports = {0x48000000: FakePort(self, 0x48000000), 0x48000400: FakePort(self, 0x48000400)}
+        self.emitters_on = True
+
+    def find(self, addr):
+        '''!@brief                      Finds the port of a register address.
+            @param addr                 The address of the register
+            @return                     The port and the offset of the register in it
+        '''
+        base = addr & ~0x3FF
+        return self.ports[base], addr - base
+
+## The board used by the fake pins and the fake stm module
+board = FakeBoard()
+
+class FakePin:
+    '''!@brief                          A pin named by its port address and number, as (gpio, pin).
+        @details                        Pins named by a string are emitter pins, which turn the emitters of
+                                        the fake board on and off.
+    '''
+    OUT_PP = 1
+    IN = 0
+
+    def __init__(self, name, mode=None, pull=None):
+        self.name = name
+
+    def gpio(self):
+        return self.name[0]
+
+    def pin(self):
+        return self.name[1]
+
+    def high(self):
+        pass
+
+    def init(self, mode):
+        pass
+
+    def value(self, level=None):
+        if level is not None and isinstance(self.name, str):
+            board.emitters_on = bool(level)
+
+class FakeTimer:
+    '''!@brief                          A timer which holds its callback to be called by the test.
+    '''
+
+    def __init__(self):
+        self.cb = None
+
+    def freq(self):
+        return 20_000
+
+    def callback(self, cb):
+        self.cb = cb
+
+bno055emu.install()
+stm = types.ModuleType('stm')
+stm.GPIO_MODER = GPIO_MODER
+stm.GPIO_IDR = GPIO_IDR
+stm.mem16 = FakeMem(board, 2)
+stm.mem32 = FakeMem(board, 4)
+sys.modules['stm'] = stm
+sys.modules['pyb'].Pin = FakePin
+sys.modules.pop('linesensor', None)
+import linesensor
+linesensor.ticks_us = board.clock.ticks_us
+linesensor.ticks_diff = lambda new, old: new - old
+linesensor.sleep_us = board.clock.sleep_us
+
+## The sensor pins in reading order, split over two ports and both halves of the mode registers
+PINS = [(0x48000000, 15), (0x48000400, 1), (0x48000400, 15), (0x48000400, 14),
+        (0x48000400, 13), (0x48000000, 2), (0x48000000, 9), (0x48000400, 8)]
+
+def make_array(decay_on, decay_off=None, **kwargs):
+    '''!@brief                          Sets the decay time of each fake sensor and creates the array.
+        @param decay_on                 The decay time in microseconds of each channel with the emitters on
+        @param decay_off                The decay time of each channel with the emitters off, or None for
+                                        the same times
+        @param kwargs                   Other arguments of LineSensorArray
+        @return                         The LineSensorArray object
+    '''
+    if decay_off is None:
+        decay_off = decay_on
+    for port in board.ports.values():
+        port.decay_on.clear()
+        port.decay_off.clear()
+    for (gpio, pin), on, off in zip(PINS, decay_on, decay_off):
+        board.ports[gpio].decay_on[pin] = on
+        board.ports[gpio].decay_off[pin] = off
+    return linesensor.LineSensorArray(PINS, **kwargs)
+
+def check_times(times, decay):
+    '''!@brief                          Checks that each time is its decay time, to within one pass.
+        @param times                    The measured decay times
+        @param decay                    The decay time of each channel
+    '''
+    for time, expected in zip(times, decay):
+        assert expected - 2*STEP_US <= time <= expected + 2*STEP_US
+
+def test_read_sensors_times_every_channel():
+    decay = [300, 650, 1000, 1400, 1800, 2100, 800, 450]
+    line_array = make_array(decay)
+    check_times(line_array.read_sensors(), decay)
+    assert line_array.saturated == 0
+
+def test_release_only_switches_sensor_pins():
+    line_array = make_array(8*[500])
+    line_array.read_sensors()
+    # The sensor pins are left as inputs and every other pin keeps its analog mode
+    for port in board.ports.values():
+        for pin in range(16):
+            mode = (port.moder >> 2*pin) & 0b11
+            assert mode == (0b00 if pin in port.decay_on else 0b11)
+
+def test_saturated_channels_read_timeout():
+    decay = [300, 9000, 1000, 1400, 9000, 2100, 800, 450]
+    line_array = make_array(decay, timeout=2500)
+    times = line_array.read_sensors()
+    assert times[1] == 2500 and times[4] == 2500
+    check_times([times[n] for n in (0, 2, 3, 5, 6, 7)], [decay[n] for n in (0, 2, 3, 5, 6, 7)])
+    assert line_array.saturated == 0b00010010
+
+def test_timer_measurement_compensates_ambient():
+    decay_on = [300, 650, 1000, 1400, 1800, 2100, 800, 450]
+    decay_off = [2000, 2000, 2500, 2500, 1500, 2500, 2500, 2500]
+    timer = FakeTimer()
+    line_array = make_array(decay_on, decay_off, timer=timer, emitter_pins=('odd', 'even'),
+                            ambient_every=1)
+    line_array.start_measurement()
+    ticks = 0
+    while not line_array.poll():
+        board.clock.now += 50
+        timer.cb(timer)
+        ticks += 1
+    assert 1_000_000//timer.freq()*ticks <= line_array.max_read_time() + 50
+    assert board.emitters_on
+    # Each time is lengthened by the ambient light, to within one timer tick
+    for time, on, off in zip(line_array.result(), decay_on, decay_off):
+        expected = min(on + 2500 - off, 2500)
+        assert expected - 60 <= time <= expected + 60
@@ -0,0 +1,74 @@
+'''!@file                          tracedump.py
+    @brief                         A program to print the task traces dumped by the scheduler.
+    @details                       A program run on a computer, not on the Nucleo, which reads a
+                                   capture of the UART after the scheduler has written the
+                                   transition traces of the tasks with TaskList.dump_traces(), and
+                                   prints the state transitions of each task. Each task's dump
+                                   starts with TRC1, so any text printed on the same UART around
+                                   the dumps is skipped. Run it as: python tracedump.py capture.bin
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+import sys
+from array import array
+
+## The bytes which start the binary dump of each task's trace
+TRACE_MAGIC = b'TRC1'
+
+## The number of values of utime.ticks_us() before it wraps around
+TICKS_PERIOD = 1 << 30
+
+def read_traces(data):
+    '''!@brief                          Finds the task traces in a capture.
+        @param data                     The bytes of the capture
+        @return                         A list of tuples of the task name, the state the oldest entry was a
+                                        transition from, the list of entry times in microseconds, and the list
+                                        of states each entry was a transition to
+    '''
+    traces = []
+    start = data.find(TRACE_MAGIC)
+    while start >= 0:
+        n = start + len(TRACE_MAGIC)
+        name_length = data[n]
+        name = data[n + 1:n + 1 + name_length].decode()
+        n += 1 + name_length
+        count = data[n] | (data[n + 1] << 8)
+        first = data[n + 2]
+        n += 3
+        times = array('I')
+        times.frombytes(data[n:n + 4*count])
+        if sys.byteorder != 'little':
+            times.byteswap()
+        n += 4*count
+        states = list(data[n:n + count])
+        n += count
+        traces.append((name, first, list(times), states))
+        start = data.find(TRACE_MAGIC, n)
+    return traces
+
+def format_trace(name, first, times, states):
+    '''!@brief                          Puts one task's trace into a string.
+        @details                        The times are shown in seconds since the oldest entry, found with
+                                        the same wrap around as utime.ticks_diff().
+        @param name                     The name of the task
+        @param first                    The state the oldest entry was a transition from
+        @param times                    The entry times from utime.ticks_us()
+        @param states                   The states each entry was a transition to
+        @return                         A string with one line for each transition
+    '''
+    tr_str = f"Task {name}: {len(times)} transitions\n"
+    last_state = first
+    for time, state in zip(times, states):
+        elapsed = (time - times[0]) % TICKS_PERIOD
+        tr_str += f"{elapsed/1_000_000: 12.6f}: {last_state: 2d} -> {state:d}\n"
+        last_state = state
+    return tr_str
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python tracedump.py capture.bin")
+        sys.exit(1)
+    with open(sys.argv[1], 'rb') as capture:
+        for trace in read_traces(capture.read()):
+            print(format_trace(*trace))
@@ -0,0 +1,94 @@
+'''!@file                          velestimator.py
+    @brief                         A class to estimate the velocity of a wheel from encoder samples.
+    @details                       A hybrid velocity estimator for the Romi encoders. At high speed
+                                   the encoder moves many counts each period, so the velocity is the
+                                   change in counts over the last period. At low speed only a few
+                                   counts pass each period and that estimate jumps between a few
+                                   values, so the window is stretched back over earlier samples until
+                                   enough counts have passed, which measures the time the counts took
+                                   instead. The samples are kept in array ring buffers.
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+from array import array
+from time import ticks_diff
+
+# The native code emitter is only available in MicroPython. On a host, the
+# estimator runs as plain Python instead.
+try:
+    from micropython import native
+except ImportError:
+    def native(fun):
+        return fun
+
+class VelEstimator:
+    '''!@brief                          A hybrid count and period velocity estimator for one encoder.
+        @details                        Objects of this class are given the encoder position and time each
+                                        period. The velocity is found over the shortest window of recent
+                                        samples in which at least min_counts counts have passed, up to the
+                                        whole ring buffer or max_window_us. At high speed this is the count
+                                        per period estimate, and at low speed it becomes a measurement of
+                                        the time for min_counts counts. No memory is allocated for an update.
+    '''
+
+    def __init__(self, size=16, min_counts=4, max_window_us=100_000):
+        '''!@brief                      Creates an object of the VelEstimator class.
+            @param size                 The number of samples kept in the ring buffer, which sets the
+                                        longest window
+            @param min_counts           The number of counts which must pass in the window for the
+                                        velocity to be found from it
+            @param max_window_us        The longest window in microseconds. If fewer than min_counts
+                                        counts pass in this time, the velocity is found over this window.
+        '''
+        self.size = size
+        self.min_counts = min_counts
+        self.max_window_us = max_window_us
+        # Create the ring buffers of sample times and positions
+        self.times = array('l', size*[0])
+        self.positions = array('l', size*[0])
+        self.newest = 0
+        self.num_samples = 0
+        self.velocity = 0
+
+    def reset(self):
+        '''!@brief                      Clears the samples so the next window starts fresh.
+        '''
+        self.num_samples = 0
+        self.velocity = 0
+
+    @native
+    def update(self, position, now_us):
+        '''!@brief                      Adds a sample and finds the velocity.
+            @param position             The encoder position in counts
+            @param now_us               The time of the sample from ticks_us()
+            @return                     The velocity in counts per second, as an integer
+        '''
+        times = self.times
+        positions = self.positions
+        size = self.size
+        newest = self.newest + 1
+        if newest >= size:
+            newest = 0
+        self.newest = newest
+        times[newest] = now_us
+        positions[newest] = position
+        if self.num_samples < size:
+            self.num_samples += 1
+
+        # Stretch the window back until enough counts have passed or it is too long
+        n = newest
+        counts = 0
+        dt = 0
+        for step in range(self.num_samples - 1):
+            n -= 1
+            if n < 0:
+                n = size - 1
+            counts = position - positions[n]
+            dt = ticks_diff(now_us, times[n])
+            if counts >= self.min_counts or counts <= -self.min_counts or dt >= self.max_window_us:
+                break
+
+        if dt > 0:
+            self.velocity = counts*1_000_000//dt
+        return self.velocity
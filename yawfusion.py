@@ -0,0 +1,90 @@
+'''!@file                          yawfusion.py
+    @brief                         A class to fuse the encoder and gyro yaw rates of the robot.
+    @details                       A complementary filter that combines the yaw rate found from
+                                   the wheel encoders with the yaw rate from the IMU gyro. The gyro
+                                   is fast and smooth but drifts, while the encoders don't drift but
+                                   are noisy and are wrong when a wheel slips. The filter uses the
+                                   gyro for the yaw rate and slowly learns its bias from the
+                                   encoders, and stops learning while the two disagree, as they
+                                   do when a wheel slips.
+    @author                        Cole Lunde and Nate Hempstead
+    @date                          December 13, 2024
+'''
+
+from array import array
+
+## Scale from the raw BNO055 gyro value, in sixteenths of a degree per second, to radians per second
+GYRO_SCALE = 3.14159265/(180*16)
+
+class YawFusion:
+    '''!@brief                          A complementary filter for the yaw rate of the Romi robot.
+        @details                        Objects of this class take the encoder yaw rate and the raw gyro yaw
+                                        rate each control period and return the fused yaw rate in radians per
+                                        second. The state is kept in a preallocated array so no objects are
+                                        kept between updates.
+    '''
+
+    def __init__(self, gain=0.02, slip_limit=0.5, slip_count=3, gyro_sign=1):
+        '''!@brief                      Creates an object of the YawFusion class.
+            @param gain                 The fraction of the difference between the gyro and encoder yaw rates
+                                        added to the gyro bias each update. Smaller values make the bias
+                                        learn more slowly but filter out more encoder noise.
+            @param slip_limit           The difference in radians per second between the corrected gyro and
+                                        encoder yaw rates above which a wheel may be slipping
+            @param slip_count           The number of updates in a row over the slip limit after which a
+                                        wheel is taken to be slipping
+            @param gyro_sign            1 if the gyro yaw rate is positive counterclockwise like the encoder
+                                        yaw rate, or -1 if the IMU is mounted so that it is reversed
+        '''
+        self.gain = gain
+        self.slip_limit = slip_limit
+        self.slip_count = slip_count
+        self.gyro_scale = gyro_sign*GYRO_SCALE
+        # Create the state array holding the fused yaw rate, the gyro bias, and the
+        # difference between the corrected gyro and encoder yaw rates
+        self.state = array('f', [0, 0, 0])
+        self.num_over = 0
+
+    def update(self, enc_yaw_rate, gyro_raw):
+        '''!@brief                      Finds the fused yaw rate from the encoder and gyro yaw rates.
+            @details                    The gyro bias is removed from the gyro yaw rate. If the result and the
+                                        encoder yaw rate agree, the bias is moved toward their difference.
+                                        While they are over the slip limit the bias is held, and after
+                                        slip_count updates in a row a wheel is taken to be slipping.
+            @param enc_yaw_rate         The yaw rate from the wheel encoders in radians per second
+            @param gyro_raw             The raw yaw rate from the BNO055 in sixteenths of a degree per second
+            @return                     The fused yaw rate in radians per second
+        '''
+        state = self.state
+        gyro_yaw_rate = gyro_raw*self.gyro_scale
+        bias = state[1]
+        fused = gyro_yaw_rate - bias
+        diff = fused - enc_yaw_rate
+
+        # Count the updates in a row with the gyro and encoders disagreeing
+        if diff > self.slip_limit or diff < -self.slip_limit:
+            self.num_over += 1
+        else:
+            self.num_over = 0
+
+        # Only learn the gyro bias while the gyro and encoders agree, so the first
+        # updates of a slip don't pull the bias before it is detected
+        if self.num_over == 0:
+            state[1] = bias + self.gain*(gyro_yaw_rate - enc_yaw_rate - bias)
+
+        state[0] = fused
+        state[2] = diff
+        return fused
+
+    def slipping(self):
+        '''!@brief                      Checks if a wheel is slipping.
+            @return                     True if the gyro and encoder yaw rates have disagreed for slip_count
+                                        updates in a row, False if they have not
+        '''
+        return self.num_over >= self.slip_count
+
+    def bias(self):
+        '''!@brief                      Gets the gyro bias learned from the encoders.
+            @return                     The gyro bias in radians per second
+        '''
+        return self.state[1]